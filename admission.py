@@ -0,0 +1,132 @@
+import math
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost=1):
+        self._refill()
+        if cost > self.burst:
+            return math.inf
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def take(self, cost=1):
+        self._refill()
+        self.tokens -= cost
+
+
+class AdmissionController:
+    def __init__(self, peer_rate=100.0, peer_burst=2000, sender_rate=10.0, sender_burst=1000,
+                 queue_depth=256, max_buckets=10000):
+        self.peer_rate = peer_rate
+        self.peer_burst = peer_burst
+        self.sender_rate = sender_rate
+        self.sender_burst = sender_burst
+        self.max_buckets = max_buckets
+        self.queue = queue.Queue(maxsize=queue_depth)
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "peer_rate": 0, "sender_rate": 0, "too_large": 0}
+        self.processed = 0
+        self.failed = 0
+        self.job_seconds = 0.0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def start(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="ingress", daemon=True)
+            self._worker.start()
+
+    def _bucket(self, key, rate, burst):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, burst)
+            # Idle buckets are refilled anyway, so dropping the oldest only forgets spent budget
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        return bucket
+
+    def queue_retry_after(self):
+        average = self.job_seconds / self.processed if self.processed else 0.1
+        return max(1.0, self.queue.qsize() * average)
+
+    def check(self, peer, senders):
+        # Returns None once admitted, else (reason, retry_after); rejected requests are not charged
+        with self._lock:
+            if self.queue.full():
+                self.rejected["queue_full"] += 1
+                return "queue_full", self.queue_retry_after()
+            charges = [(self._bucket(("peer", peer), self.peer_rate, self.peer_burst), len(senders), "peer_rate")]
+            charges += [
+                (self._bucket(("sender", sender), self.sender_rate, self.sender_burst), count, "sender_rate")
+                for sender, count in Counter(senders).items()
+            ]
+            for bucket, cost, reason in charges:
+                wait = bucket.wait_time(cost)
+                if math.isinf(wait):
+                    self.rejected["too_large"] += 1
+                    return "too_large", None
+                if wait > 0:
+                    self.rejected[reason] += 1
+                    return reason, wait
+            for bucket, cost, _ in charges:
+                bucket.take(cost)
+            self.admitted += 1
+            return None
+
+    def submit(self, job):
+        try:
+            self.queue.put_nowait(job)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.rejected["queue_full"] += 1
+            return False
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            start_time = time.perf_counter()
+            try:
+                job()
+            except Exception as e:
+                self.failed += 1
+                print(f"Ingress job failed: {e}")
+            finally:
+                self.processed += 1
+                self.job_seconds += time.perf_counter() - start_time
+                self.queue.task_done()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self.queue.maxsize,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "processed": self.processed,
+                "failed": self.failed,
+                "average_job_ms": round(self.job_seconds / self.processed * 1000, 3) if self.processed else 0.0,
+                "tracked_buckets": len(self._buckets),
+                "limits": {
+                    "peer_rate": self.peer_rate,
+                    "peer_burst": self.peer_burst,
+                    "sender_rate": self.sender_rate,
+                    "sender_burst": self.sender_burst
+                }
+            }
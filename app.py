@@ -1,15 +1,76 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
+from werkzeug.routing import PathConverter
 from blockchain import BlockChain, Block, Wallet, Transaction
+from mining import MiningWorker
+from merkle import MerkleTree, transaction_hash
+from signatures import (
+    SIGNED_FIELDS, TRANSACTION_FIELDS, LRUCache, cache_stats, check_signed_fields, has_unsigned_fields, is_number
+)
+from validation import BlockValidationError, BlockValidator
+from state import is_coinbase
+from snapshot import SnapshotManager
+from scheduler import MiningScheduler
+from admission import AdmissionController
+from seen import SeenCache
+from peers import NODE_ADDRESS_HEADER
+from compact import compact_block, reconstruct_block
+from wire import CONTENT_TYPE, WireFormatError, decode_block, encode_block, encode_blocks
+import os
 import sys
+import json
+import math
 import requests
 import psutil
 import time
 import threading
 from urllib.parse import urlparse
 
+
+class AddressConverter(PathConverter):
+    # Wallet addresses are PEM public keys, which contain slashes and newlines
+    regex = r"[\s\S]+?"
+
+
 app = Flask(__name__)
+app.url_map.converters['address'] = AddressConverter
 blockchain = None
 wallet = None
+miner = None
+block_validator = None
+scheduler = None
+snapshots = None
+node_address = None
+boot_report = {}
+compact_relay_stats = {"reconstructed": 0, "incomplete": 0, "mempool_transactions": 0, "prefilled_transactions": 0}
+MAX_HEADERS_PER_REQUEST = 2000
+MAX_BLOCKS_PER_REQUEST = 200
+MAX_HISTORY_PER_REQUEST = 200
+MAX_BATCH_TRANSACTIONS = 1000
+MAX_ANNOUNCE_ATTEMPTS = 3
+block_json_cache = LRUCache(4096)
+admission = AdmissionController()
+seen_transactions = SeenCache()
+seen_blocks = SeenCache(max_entries=10000)
+gossip_drops = {"inventory": 0, "mempool": 0, "batch": 0, "blocks": 0, "compact_blocks": 0}
+
+
+def requested_range(limit):
+    length = len(blockchain.chain)
+    start = max(request.args.get('from', 0, type=int), 0)
+    end = min(request.args.get('to', length - 1, type=int), length - 1, start + limit - 1)
+    return start, end
+
+
+def wants_binary():
+    return CONTENT_TYPE in request.headers.get('Accept', '')
+
+
+def blocks_response(key, blocks, length):
+    if wants_binary():
+        compress = request.args.get('compress', 0, type=int) == 1
+        return Response(encode_blocks(blocks, length, compress=compress), mimetype=CONTENT_TYPE), 200
+    return jsonify({"length": length, key: blocks}), 200
+
 
 @app.route('/wallet', methods=['POST'])
 def get_wallet_details():
@@ -29,64 +90,200 @@ def receive_wallet_details():
     try:
         data = request.get_json()
         public_key = data['public_key']
-        balance = data['balance']
         sender_address = data['node_address']
-        blockchain.wallets[public_key] = balance
+        print(f"Peer {sender_address} announced wallet {public_key[:60]}...")
         my_wallet_details = {
             "public_key": wallet.get_address(),
             "balance": blockchain.get_wallet_balance(wallet.get_address()),
-            "node_address": f"http://localhost:{port}"
+            "node_address": node_address
         }
-        response = requests.post(f"{sender_address}/wallet_details/update", json=my_wallet_details)
+        response = blockchain.peers.post(f"{sender_address}/wallet_details/update", json=my_wallet_details)
         if response.status_code == 200:
-            return jsonify({"status": "success", "message": "Wallet details updated and sent back."}), 200
+            return jsonify({"status": "success", "message": "Wallet details received and sent back."}), 200
         else:
-            return jsonify({"status": "partial_success", "message": "Wallet details updated but failed to send back."}), 200
+            return jsonify({"status": "partial_success", "message": "Wallet details received but failed to send back."}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/wallet_details/update', methods=['POST'])
 def update_wallet_details():
     try:
-        # Get wallet details from incoming JSON
+        # Balances are derived from the chain, so announced balances are informational only
         data = request.get_json()
         public_key = data['public_key']
-        balance = data['balance']
-        
-        # Add the wallet details to your local blockchain wallet dictionary
-        blockchain.wallets[public_key] = balance
-        return jsonify({"status": "success", "message": "Wallet details received and updated."}), 200
+        print(f"Peer wallet {public_key[:60]}... reports balance {data.get('balance')}")
+        return jsonify({"status": "success", "message": "Wallet details received."}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/mempool', methods=['GET'])
 def get_mempool():
-    return jsonify({"mempool": blockchain.mempool}), 200
+    return jsonify({"mempool": blockchain.mempool.to_list()}), 200
+
+def ingress_peer():
+    # The advertised address is unauthenticated, so it only splits the bucket of the connecting address:
+    # local nodes sharing 127.0.0.1 get one bucket each, and nobody can spend another host's tokens
+    advertised = request.headers.get(NODE_ADDRESS_HEADER)
+    if advertised in blockchain.nodes:
+        return request.remote_addr, advertised
+    return request.remote_addr
+
+
+def throttled(transactions):
+    senders = [transaction.get("sender") for transaction in transactions if isinstance(transaction, dict)]
+    rejection = admission.check(ingress_peer(), senders)
+    if rejection is None:
+        return None
+    reason, retry_after = rejection
+    if retry_after is None:
+        return jsonify({"error": "Request is larger than the ingress rate limit allows", "reason": reason}), 413
+    response = jsonify({
+        "error": "Node is overloaded, retry later",
+        "reason": reason,
+        "retry_after": round(retry_after, 3)
+    })
+    response.headers["Retry-After"] = str(math.ceil(retry_after))
+    return response, 429
+
+
+def queue_full_response():
+    response = jsonify({"error": "Node is overloaded, retry later", "reason": "queue_full"})
+    response.headers["Retry-After"] = str(math.ceil(admission.queue_retry_after()))
+    return response, 429
+
+
+def admit_to_mempool(transactions):
+    transactions = [
+        transaction for transaction in transactions
+        if isinstance(transaction, dict) and not is_coinbase(transaction) and not has_unsigned_fields(transaction)
+    ]
+    signatures = block_validator.check_signatures(transactions)
+    added = sum(
+        1 for transaction, valid in zip(transactions, signatures)
+        if valid and blockchain.add_to_mempool(transaction)
+    )
+    if added < len(signatures):
+        print(f"Dropped {len(signatures) - added} gossiped transactions (invalid, duplicate or evicted)")
+    return added
+
+
+def enqueue_mempool(transactions):
+    fresh = {}
+    for transaction in transactions:
+        if isinstance(transaction, dict):
+            txid = transaction_hash(transaction)
+            if txid not in fresh and txid not in seen_transactions:
+                fresh[txid] = transaction
+    duplicates = len(transactions) - len(fresh)
+    gossip_drops["mempool"] += duplicates
+    if not fresh:
+        return jsonify({"message": "Transactions already seen", "queued": 0, "duplicates": duplicates}), 200
+    transactions = list(fresh.values())
+    rejected = throttled(transactions)
+    if rejected:
+        return rejected
+    if not admission.submit(lambda: admit_to_mempool(transactions)):
+        return queue_full_response()
+    # Marked only once queued, so a peer retrying after a 429 is not dropped as a duplicate
+    for txid in fresh:
+        seen_transactions.add(txid)
+    return jsonify({
+        "message": "Transactions queued for the mempool",
+        "queued": len(transactions),
+        "duplicates": duplicates
+    }), 202
+
+
+def mark_block_seen(block):
+    seen_blocks.add(block.hash)
+    for transaction in block.transactions:
+        seen_transactions.add(transaction_hash(transaction))
+
+
+def queue_announcement(transactions):
+    for transaction in transactions:
+        seen_transactions.add(transaction_hash(transaction))
+    # Relaying runs on the ingress worker so request threads never wait on peers
+    if not admission.submit(lambda: announce_transactions(transactions)):
+        print(f"Ingress queue is full, not announcing {len(transactions)} transactions")
+
 
 @app.route('/update_mempool', methods=['POST'])
 def update_mempool():
-    try:
-        data = request.json
-        new_mempool = data.get('mempool')
-        if new_mempool is None:
-            return jsonify({"error": "Mempool data is required"}), 400
-
-        blockchain.mempool = new_mempool 
-        return jsonify({"message": "Mempool updated successfully"}), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    data = request.json or {}
+    new_mempool = data.get('mempool')
+    if not isinstance(new_mempool, list):
+        return jsonify({"error": "Mempool data is required"}), 400
+    return enqueue_mempool(new_mempool)
 
 @app.route('/add_mempool', methods=['POST'])
 def append_mempool():
+    data = request.json or {}
+    transactions = data.get("transactions")
+    if not transactions or not isinstance(transactions, list):
+        return jsonify({"error": "Transactions are required"}), 400
+    return enqueue_mempool(transactions)
+
+
+@app.route('/mempool/inv', methods=['POST'])
+def mempool_inventory():
+    data = request.json or {}
+    txids = data.get("txids")
+    if txids is None:
+        return jsonify({"error": "Transaction IDs are required"}), 400
+    missing = [txid for txid in txids if txid not in blockchain.mempool and txid not in seen_transactions]
+    gossip_drops["inventory"] += len(txids) - len(missing)
+    return jsonify({"missing": missing}), 200
+
+
+class PeerBusy(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"peer is overloaded, retry in {retry_after:g} seconds")
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(response):
     try:
-        data = request.json
-        transactions = data.get("transactions")[0]
-        if transactions is None:
-            return jsonify({"error": "Transactions are required"}), 400
-        blockchain.mempool.append(transactions) 
-        return jsonify({"message": "Transaction added to mempool successfully"}), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return max(float(response.headers.get("Retry-After", 1)), 0.0)
+    except ValueError:
+        return 1.0
+
+
+def retry_announcement(transactions, node, delay, attempt):
+    def requeue():
+        if not admission.submit(lambda: announce_transactions(transactions, [node], attempt)):
+            print(f"Ingress queue is full, not retrying the announcement to {node}")
+
+    timer = threading.Timer(delay, requeue)
+    timer.daemon = True
+    timer.start()
+
+
+def announce_transactions(transactions, nodes=None, attempt=1):
+    by_txid = {transaction_hash(transaction): transaction for transaction in transactions}
+
+    def relay(node):
+        response = blockchain.peers.post(f"{node}/mempool/inv", json={"txids": list(by_txid)})
+        response.raise_for_status()
+        missing = [by_txid[txid] for txid in response.json().get("missing", []) if txid in by_txid]
+        if missing:
+            response = blockchain.peers.post(f"{node}/add_mempool", json={"transactions": missing})
+            if response.status_code == 429:
+                raise PeerBusy(retry_after_seconds(response))
+            response.raise_for_status()
+        return len(missing)
+
+    results = blockchain.peers.gather(blockchain.nodes if nodes is None else nodes, relay)
+    for node, sent in results.items():
+        if isinstance(sent, PeerBusy) and attempt < MAX_ANNOUNCE_ATTEMPTS:
+            # The peer only marks transactions seen once queued, so the retry is not dropped as a duplicate
+            print(f"Peer {node} is overloaded, announcing again in {sent.retry_after:g} seconds")
+            retry_announcement(transactions, node, sent.retry_after, attempt + 1)
+        elif isinstance(sent, Exception):
+            print(f"Error announcing transactions to {node}: {sent}")
+        else:
+            print(f"Announced {len(by_txid)} transactions to {node}, sent {sent}")
+    return results
 
 
 @app.route('/transaction', methods=['POST'])
@@ -97,21 +294,18 @@ def create_transaction():
     amount = data.get('amount') 
     if not all([sender, receiver, amount is not None]):
         return jsonify({"error": "Sender, receiver, amount are required"}), 400
+    if not isinstance(sender, str) or not isinstance(receiver, str) or not is_number(amount) or amount < 0:
+        return jsonify({"error": "Sender and receiver must be strings and amount a non-negative number"}), 400
+    if is_coinbase(data):
+        return jsonify({"error": "Coinbase transactions cannot be submitted"}), 400
+    rejected = throttled([data])
+    if rejected:
+        return rejected
     transaction = Transaction(wallet, sender, receiver, amount)
     if transaction.validate_transaction(blockchain):
         transaction_data = transaction.to_dict()
-        payload = {
-            "transactions": [transaction.to_dict()]
-        }
-        for node in blockchain.nodes:
-            try:
-                response = requests.post(f"{node}/add_mempool", json=payload, timeout=5)
-                if response.status_code == 201:
-                    print(f"Transaction added to {node} mempool")
-                else:
-                    print(f"Failed to broadcast transaction to {node}: {response.status_code}")
-            except requests.exceptions.RequestException as e:
-                print(f"Error broadcasting transaction to {node}: {e}")
+        blockchain.add_to_mempool(transaction_data)
+        queue_announcement([transaction_data])
         return jsonify({
             "message": "Transaction validated and added to the mempool"
         }), 201
@@ -119,6 +313,90 @@ def create_transaction():
         return jsonify({"error": "Invalid transaction"}), 400
 
 
+def batch_item(item):
+    if not isinstance(item, dict):
+        raise ValueError("Transaction must be an object")
+    if "signature" in item:
+        missing = [field for field in TRANSACTION_FIELDS if item.get(field) is None]
+        if missing:
+            raise ValueError(f"Signed transaction is missing {', '.join(missing)}")
+        transaction_data = {field: item[field] for field in TRANSACTION_FIELDS}
+        check_signed_fields(*(transaction_data[field] for field in SIGNED_FIELDS))
+    else:
+        if not all([item.get('sender'), item.get('receiver'), item.get('amount') is not None]):
+            raise ValueError("Sender, receiver, amount are required")
+        transaction_data = None
+    amount = item["amount"]
+    if not is_number(amount) or amount < 0:
+        raise ValueError("Amount must be a non-negative number")
+    fee = item.get("fee")
+    if fee is not None and (not is_number(fee) or fee < 0):
+        raise ValueError("Fee must be a non-negative number")
+    if is_coinbase(item):
+        raise ValueError("Coinbase transactions cannot be submitted")
+    if transaction_data is None:
+        transaction_data = Transaction(wallet, item['sender'], item['receiver'], amount, item.get('fee')).to_dict()
+    return transaction_data
+
+
+@app.route('/transactions/batch', methods=['POST'])
+def create_transactions_batch():
+    data = request.json or {}
+    items = data.get("transactions")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Transactions are required"}), 400
+    if len(items) > MAX_BATCH_TRANSACTIONS:
+        return jsonify({"error": f"At most {MAX_BATCH_TRANSACTIONS} transactions per batch"}), 400
+    rejected = throttled(items)
+    if rejected:
+        return rejected
+
+    results = [None] * len(items)
+    candidates = []
+    batch_txids = set()
+    for position, item in enumerate(items):
+        try:
+            transaction_data = batch_item(item)
+        except (KeyError, TypeError, ValueError) as e:
+            results[position] = {"status": "rejected", "error": str(e)}
+            continue
+        txid = transaction_hash(transaction_data)
+        # Duplicates are settled before any signature is checked
+        if txid in batch_txids or txid in blockchain.mempool or txid in seen_transactions:
+            gossip_drops["batch"] += 1
+            results[position] = {"status": "duplicate", "txid": txid}
+            continue
+        batch_txids.add(txid)
+        candidates.append((position, txid, transaction_data))
+
+    signatures = block_validator.check_signatures([transaction_data for _, _, transaction_data in candidates])
+    accepted = []
+    spent = {}
+    for (position, txid, transaction_data), valid in zip(candidates, signatures):
+        sender = transaction_data["sender"]
+        if not valid:
+            results[position] = {"status": "rejected", "txid": txid, "error": "Invalid signature"}
+            continue
+        # Earlier payments in the batch draw down the same balance as later ones
+        remaining = spent.get(sender, blockchain.spendable_balance(sender)) - transaction_data["amount"] - transaction_data["fee"]
+        if remaining < 0:
+            results[position] = {"status": "rejected", "txid": txid, "error": "Insufficient balance"}
+            continue
+        if not blockchain.add_to_mempool(transaction_data):
+            results[position] = {"status": "rejected", "txid": txid, "error": "Mempool is full"}
+            continue
+        spent[sender] = remaining
+        accepted.append(transaction_data)
+        results[position] = {"status": "accepted", "txid": txid}
+
+    if accepted:
+        queue_announcement(accepted)
+    counts = {"accepted": 0, "duplicate": 0, "rejected": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return jsonify(dict(counts, results=results)), 200
+
+
 @app.route('/transaction_simulation', methods=['POST'])
 def create_transaction_simulation():
     data = request.json
@@ -127,23 +405,170 @@ def create_transaction_simulation():
     amount = data.get('amount')
     if not all([sender, receiver, amount is not None]):
         return jsonify({"error": "Sender, receiver, and amount are required"}), 400
+    if not isinstance(sender, str) or not isinstance(receiver, str) or not is_number(amount) or amount < 0:
+        return jsonify({"error": "Sender and receiver must be strings and amount a non-negative number"}), 400
+    rejected = throttled([data])
+    if rejected:
+        return rejected
     transaction = Transaction(wallet, sender, receiver, amount)
     transaction_data = transaction.to_dict()
-    for node in blockchain.nodes:
-        try:
-            response = requests.post(f"{node}/add_mempool", json=transaction_data, timeout=5)
-            if response.status_code == 201:
-                print(f"Transaction broadcasted to {node}")
-            else:
-                print(f"Failed to broadcast transaction to {node}: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error broadcasting transaction to {node}: {e}")
+    queue_announcement([transaction_data])
+    return jsonify({"message": "Transaction broadcast without validation"}), 201
+
+
+def block_json(height, headers_only):
+    key = (blockchain.block_hash_at(height), headers_only)
+    serialized = block_json_cache.get(key)
+    if serialized is None:
+        block = blockchain.chain[height]
+        serialized = json.dumps(block.header() if headers_only else vars(block), sort_keys=True, separators=(",", ":"))
+        block_json_cache.put(key, serialized)
+    return serialized
 
 
 @app.route('/chain', methods=['GET'])
 def get_chain():
-    chain_data = [vars(block) for block in blockchain.chain]
-    return jsonify({"length": len(chain_data), "chain": chain_data}), 200
+    length = len(blockchain.chain)
+    headers_only = request.args.get('headers', 0, type=int) == 1
+    binary = wants_binary() and not headers_only
+    # A binary payload is encoded in one piece, so it is paged like /blocks instead of streamed
+    start, end = requested_range(MAX_BLOCKS_PER_REQUEST if binary else length)
+    key = "headers" if headers_only else "chain"
+    end_hash = blockchain.block_hash_at(end) if end >= start else ""
+    etag = f"{key}-{length}-{start}-{end}-{end_hash}"
+    if binary:
+        etag = f"{etag}-binary-{request.args.get('compress', 0, type=int)}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    if binary:
+        response, status = blocks_response("chain", [vars(blockchain.chain[i]) for i in range(start, end + 1)], length)
+        response.set_etag(etag)
+        return response, status
+
+    def generate():
+        yield f'{{"length":{length},"{key}":['
+        for height in range(start, end + 1):
+            try:
+                serialized = block_json(height, headers_only)
+            except IndexError:
+                # The chain was reorganized below this height while streaming
+                break
+            yield serialized if height == start else f",{serialized}"
+        yield "]}\n"
+
+    response = Response(generate(), mimetype="application/json")
+    response.set_etag(etag)
+    return response
+
+
+@app.route('/headers', methods=['GET'])
+def get_headers():
+    start, end = requested_range(MAX_HEADERS_PER_REQUEST)
+    headers = [blockchain.chain[i].header() for i in range(start, end + 1)]
+    return jsonify({"length": len(blockchain.chain), "headers": headers}), 200
+
+
+@app.route('/blocks', methods=['GET'])
+def get_blocks():
+    start, end = requested_range(MAX_BLOCKS_PER_REQUEST)
+    blocks = [vars(blockchain.chain[i]) for i in range(start, end + 1)]
+    return blocks_response("blocks", blocks, len(blockchain.chain))
+
+
+@app.route('/block/<block_hash>', methods=['GET'])
+def get_block_by_hash(block_hash):
+    block = blockchain.get_block_by_hash(block_hash)
+    if block is None:
+        return jsonify({"error": "Block not found"}), 404
+    return jsonify(vars(block)), 200
+
+
+@app.route('/block/height/<int:height>', methods=['GET'])
+def get_block_by_height(height):
+    if height >= len(blockchain.chain):
+        return jsonify({"error": "Block not found"}), 404
+    return jsonify(vars(blockchain.chain[height])), 200
+
+
+@app.route('/tx/<txid>', methods=['GET'])
+def get_transaction(txid):
+    location = blockchain.locate_transaction(txid)
+    if location is not None:
+        block, position, transaction = location
+        return jsonify({
+            "txid": txid,
+            "status": "confirmed",
+            "block_height": block.index,
+            "block_hash": block.hash,
+            "position": position,
+            "confirmations": len(blockchain.chain) - block.index,
+            "transaction": transaction
+        }), 200
+    transaction = blockchain.mempool.get(txid)
+    if transaction is not None:
+        return jsonify({"txid": txid, "status": "pending", "transaction": transaction}), 200
+    return jsonify({"error": "Transaction not found"}), 404
+
+
+@app.route('/proof/<txid>', methods=['GET'])
+def get_transaction_proof(txid):
+    location = blockchain.locate_transaction(txid)
+    if location is None:
+        return jsonify({"error": "Transaction not found in the chain"}), 404
+    block, position, transaction = location
+    return jsonify({
+        "txid": txid,
+        "transaction": transaction,
+        "block_height": block.index,
+        "header": block.header(),
+        "position": position,
+        "proof": MerkleTree(block.transactions).proof(position)
+    }), 200
+
+
+@app.route('/address/<address:address>/transactions', methods=['GET'])
+def get_address_transactions(address):
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_HISTORY_PER_REQUEST)
+    newest_first = request.args.get('order', 'desc') != 'asc'
+    entries, total = blockchain.address_history(address, offset, limit, newest_first)
+    for entry in entries:
+        transaction = entry["transaction"]
+        if transaction.get("sender") == transaction.get("receiver"):
+            entry["direction"] = "self"
+        else:
+            entry["direction"] = "sent" if transaction.get("sender") == address else "received"
+    next_offset = offset + len(entries)
+    return jsonify({
+        "address": address,
+        "balance": blockchain.get_wallet_balance(address),
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset if next_offset < total else None,
+        "transactions": entries
+    }), 200
+
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    return jsonify({
+        "caches": dict(cache_stats(), chain_json=block_json_cache.stats()),
+        "block_validation": block_validator.stats(),
+        "boot": boot_report,
+        "compact_blocks": compact_relay_stats,
+        "chain_index": blockchain.index.stats(),
+        "mining_scheduler": scheduler.stats(),
+        "difficulty": blockchain.difficulty_stats(),
+        "ingress": admission.stats(),
+        "gossip_dedupe": {
+            "transactions": seen_transactions.stats(),
+            "blocks": seen_blocks.stats(),
+            "dropped": dict(gossip_drops)
+        }
+    }), 200
 
 
 @app.route('/verify', methods=['GET'])
@@ -152,21 +577,16 @@ def verify_integrity():
     cpu_usage_start = psutil.cpu_percent(interval=None)
 
     try:
-        for i in range(1, len(blockchain.chain)):
-            current_block = blockchain.chain[i]
-            previous_block = blockchain.chain[i - 1]
-            if current_block.previous_hash != previous_block.hash:
-                return jsonify({
-                    "valid": False,
-                    "error": f"Invalid previous hash link at index {current_block.index}",
-                    "details": "The previous hash stored in the block does not match the hash of the previous block."
-                }), 400
-            if not current_block.hash.startswith('0' * blockchain.difficulty):
-                return jsonify({
-                    "valid": False,
-                    "error": f"Block {current_block.index} does not satisfy proof-of-work",
-                    "details": "The block hash does not have the required number of leading zeros."
-                }), 400
+        report = blockchain.verifier.verify_chain(
+            blockchain.chain, full=request.args.get('full', 0, type=int) == 1
+        )
+        if not report["valid"]:
+            return jsonify({
+                "valid": False,
+                "error": f"Block {report['index']} failed verification",
+                "details": report["error"],
+                "checked_from": report["checked_from"]
+            }), 400
         end_time = time.time()
         cpu_usage_end = psutil.cpu_percent(interval=None)
         time_taken = end_time - start_time
@@ -174,6 +594,9 @@ def verify_integrity():
         return jsonify({
             "valid": True,
             "message": "Chain validation completed successfully",
+            "checked_from": report["checked_from"],
+            "checked_blocks": report["checked_blocks"],
+            "verified_height": report["verified_height"],
             "time_taken": f"{time_taken:.2f} seconds",
             "cpu_utilization": f"{cpu_utilization:.2f}%"
         }), 200
@@ -187,46 +610,95 @@ def verify_integrity():
 
 @app.route('/add_block', methods=['POST'])
 def add_block():
-    block_data = request.json
+    if request.mimetype == CONTENT_TYPE:
+        try:
+            block_data = decode_block(request.get_data())
+        except WireFormatError as e:
+            return jsonify({"error": "Invalid block data", "message": str(e)}), 400
+    else:
+        block_data = request.json
     if not block_data:
         return jsonify({"error": "Invalid block data"}), 400
+    if known_block(block_data.get("hash") if isinstance(block_data, dict) else None):
+        gossip_drops["blocks"] += 1
+        return jsonify({"status": "duplicate"}), 200
+    return accept_block(block_data)
+
+
+@app.route('/add_block_compact', methods=['POST'])
+def add_block_compact():
+    compact = request.json
+    if not compact or "header" not in compact or "short_ids" not in compact:
+        return jsonify({"error": "Invalid compact block data"}), 400
+    if known_block(compact["header"].get("hash") if isinstance(compact["header"], dict) else None):
+        gossip_drops["compact_blocks"] += 1
+        return jsonify({"status": "duplicate"}), 200
+    block_data, missing = reconstruct_block(compact, blockchain.mempool)
+    if missing:
+        compact_relay_stats["incomplete"] += 1
+        return jsonify({"status": "incomplete", "missing": missing}), 200
+    compact_relay_stats["reconstructed"] += 1
+    compact_relay_stats["prefilled_transactions"] += len(compact.get("prefilled", {}))
+    compact_relay_stats["mempool_transactions"] += len(block_data["transactions"]) - len(compact.get("prefilled", {}))
+    return accept_block(block_data)
+
+
+def known_block(block_hash):
+    return isinstance(block_hash, str) and block_hash in seen_blocks
+
+
+def accept_block(block_data):
     new_block = Block(
         block_data['index'],
         block_data['transactions'],
-        block_data['previous_hash']
+        block_data['previous_hash'],
+        target=block_data.get('target')
     )
     new_block.hash = block_data['hash']
     new_block.nonce = block_data['nonce']
     new_block.timestamp = block_data['timestamp']
-    last_block = blockchain.get_latest_block()
-    if (
-        last_block.hash == new_block.previous_hash
-        and new_block.hash.startswith('0' * blockchain.difficulty)
-        and new_block.hash == new_block.calculate_hash()
-    ):
-        result = blockchain.add_block(new_block)
-        return jsonify(result), 200
+    try:
+        result, timings = block_validator.process(new_block, block_data)
+    except BlockValidationError as e:
+        # Only blocks that are invalid on their own are remembered; a block that failed against the
+        # current tip or balances may still be accepted after this node catches up
+        if e.intrinsic:
+            seen_blocks.add(new_block.hash)
+        elif known_block(new_block.hash):
+            # Another copy of this block was accepted while this one was being checked
+            gossip_drops["blocks"] += 1
+            return jsonify({"status": "duplicate"}), 200
+        # Resolving conflicts only helps a header that does not fit this node's view of the chain
+        if e.stage != "header" or e.intrinsic:
+            return jsonify({"error": "Invalid block", "stage": e.stage, "message": str(e)}), 400
+        print(f"Block {new_block.index} rejected: {e}")
     else:
-        try:
-            resolve_url = f"http://localhost:{request.host.split(':')[1]}/nodes/resolve"
-            response = requests.get(resolve_url, timeout=5)
-            if response.status_code == 200:
-                return jsonify({
-                    "error": "Invalid block",
-                    "message": "Attempted to resolve conflicts",
-                    "resolve_response": response.json()
-                }), 400
-            else:
-                return jsonify({
-                    "error": "Invalid block",
-                    "message": "Conflict resolution failed"
-                }), 400
-        except requests.exceptions.RequestException as e:
+        blockchain.remove_from_mempool(new_block.transactions)
+        mark_block_seen(new_block)
+        miner.cancel()
+        if "confirmed_blocks" in result:
+            result["confirmed_blocks"] = [vars(block) for block in result["confirmed_blocks"]]
+        result["validation_ms"] = timings
+        return jsonify(result), 200
+    try:
+        resolve_url = f"http://localhost:{request.host.split(':')[1]}/nodes/resolve"
+        response = blockchain.peers.get(resolve_url, timeout=5)
+        if response.status_code == 200:
             return jsonify({
                 "error": "Invalid block",
-                "message": f"Conflict resolution failed: {str(e)}"
+                "message": "Attempted to resolve conflicts",
+                "resolve_response": response.json()
             }), 400
-        return jsonify({"error": "Invalid block"}), 400
+        else:
+            return jsonify({
+                "error": "Invalid block",
+                "message": "Conflict resolution failed"
+            }), 400
+    except requests.exceptions.RequestException as e:
+        return jsonify({
+            "error": "Invalid block",
+            "message": f"Conflict resolution failed: {str(e)}"
+        }), 400
 
 
 @app.route('/nodes/resolve', methods=['GET'])
@@ -237,6 +709,8 @@ def consensus():
     try:
         # Perform the conflict resolution
         replaced = blockchain.resolve_conflicts()
+        if replaced:
+            miner.cancel()
 
         end_time = time.time()  # End time for conflict resolution
         cpu_usage_end = psutil.cpu_percent(interval=None)  # Final CPU usage
@@ -246,9 +720,11 @@ def consensus():
         cpu_utilization = (cpu_usage_start + cpu_usage_end) / psutil.cpu_count()  # Average CPU utilization
 
         if replaced:
+            fork_height = blockchain.last_fork_height
             return jsonify({
                 "message": "Chain was replaced",
-                "new_chain": [vars(block) for block in blockchain.chain],
+                "fork_height": fork_height,
+                "new_chain": [vars(block) for block in blockchain.chain[fork_height + 1:]],
                 "time_taken": f"{time_taken:.2f} seconds",
                 "cpu_utilization": f"{cpu_utilization:.2f}%"
             }), 200
@@ -280,38 +756,47 @@ def broadcast_wallet_details():
             payload = {
                 "public_key": wallet_address,
                 "balance": balance,
-                "node_address": f"http://localhost:{port}"
+                "node_address": node_address
             }
 
-            for node in blockchain.nodes:
-                try:
-                    response = requests.post(f"{node}/wallet_details", json=payload, timeout=5)
-                    if response.status_code == 200:
-                        print(f"Wallet details sent to {node}")
-                except requests.exceptions.RequestException as e:
-                    print(f"Failed to send wallet details to {node}: {e}")
+            results = blockchain.peers.broadcast(blockchain.nodes, "POST", "/wallet_details", json=payload)
+            for node, response in results.items():
+                if isinstance(response, Exception):
+                    print(f"Failed to send wallet details to {node}: {response}")
+                elif response.status_code == 200:
+                    print(f"Wallet details sent to {node}")
 
             time.sleep(100)
         except Exception as e:
             print(f"Error in wallet broadcast thread: {str(e)}")
 
 
-def prioritize_mempool(mempool):
-    print("Mempool before prioritization:", mempool)
-    return sorted(
-        mempool, 
-        key=lambda tx: (-tx.get('fee', 0), tx.get('timestamp', 0))
-    )
+def relay_block(block_data):
+    compact = compact_block(block_data)
+
+    def relay(node):
+        response = blockchain.peers.post(f"{node}/add_block_compact", json=compact)
+        if response.status_code == 404:
+            return blockchain.peers.post(
+                f"{node}/add_block", data=encode_block(block_data), headers={"Content-Type": CONTENT_TYPE}
+            )
+        if response.status_code == 200 and response.json().get("status") == "incomplete":
+            missing = response.json()["missing"]
+            print(f"Node {node} is missing {len(missing)} of {len(block_data['transactions'])} block transactions")
+            response = blockchain.peers.post(
+                f"{node}/add_block_compact", json=compact_block(block_data, prefill=missing)
+            )
+        return response
 
+    return blockchain.peers.gather(blockchain.nodes, relay)
 
-def mine_block(miner_wallet):
+
+def mine_block(miner_wallet, max_transactions, max_bytes=None):
     start_time = time.time()
-    max_transactions = 2
-    if len(blockchain.mempool) < max_transactions:
-        print("Not enough transactions to mine a block")
-        return
-    prioritized_mempool = prioritize_mempool(blockchain.mempool)
-    transactions = prioritized_mempool[:max_transactions]
+    transactions = blockchain.select_transactions(max_transactions, max_bytes)
+    if not transactions:
+        print("No transactions fit in the block template")
+        return None
     total_fees = sum(tx['fee'] for tx in transactions)
     fee_transaction = {
         "sender": "SYSTEM",
@@ -322,42 +807,93 @@ def mine_block(miner_wallet):
         "timestamp": time.time(),
     }
     transactions.append(fee_transaction)
-    new_block = Block(len(blockchain.chain), transactions, blockchain.get_latest_block().hash)
-    new_block.mine_block(blockchain.difficulty)
-    blockchain.add_block(new_block)
-    blockchain.mempool = blockchain.mempool[len(prioritized_mempool):]
-    for node in blockchain.nodes:
-        try:
-            response = requests.post(f"{node}/add_block", json=vars(new_block), timeout=5)
-            if response.status_code == 200:
-                print(f"Block successfully sent to node {node}")
-            else:
-                print(f"Failed to send block to node {node}: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error connecting to node {node}: {e}")
-    for node in blockchain.nodes:
+    with blockchain.lock:
+        new_block = Block(
+            len(blockchain.chain), transactions, blockchain.get_latest_block().hash, target=blockchain.next_target()
+        )
+    if miner.mine(new_block, new_block.target) is None:
+        print("Chain tip changed while mining. Dropping stale block template.")
+        return 0
+    with blockchain.lock:
+        if new_block.previous_hash != blockchain.get_latest_block().hash:
+            print("Chain tip changed before the mined block was added. Dropping stale block.")
+            return 0
         try:
-            response = requests.post(f"{node}/update_mempool", json={"mempool": blockchain.mempool}, timeout=5)
-            if response.status_code == 200:
-                print(f"Mempool successfully synchronized with node {node}")
-            else:
-                print(f"Failed to synchronize mempool with node {node}: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error connecting to node {node}: {e}")
+            blockchain.add_block(new_block, check_balances=True)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Mined block failed the state check and was dropped: {e}")
+            return 0
+        blockchain.remove_from_mempool(transactions)
+    mark_block_seen(new_block)
+    results = relay_block(vars(new_block))
+    for node, response in results.items():
+        if isinstance(response, Exception):
+            print(f"Error connecting to node {node}: {response}")
+        elif response.status_code == 200:
+            print(f"Block successfully sent to node {node}")
+        else:
+            print(f"Failed to send block to node {node}: {response.status_code}")
     end_time = time.time()
     time_taken = end_time - start_time
     print(f"Block mined and broadcasted in {time_taken:.2f} seconds")
+    return len(transactions) - 1
+
+
+def snapshot_periodically():
+    while True:
+        time.sleep(10)
+        try:
+            snapshots.maybe_save(blockchain, wallet)
+        except (OSError, ValueError) as e:
+            print(f"Error saving state snapshot: {e}")
 
 
 def mine_blocks_periodically():
     while True:
-        print("Trying to mine......")
-        mine_block(wallet)
-        time.sleep(5)
+        decision = scheduler.next_template()
+        print(f"Mining a block template: {decision['pending']} pending transactions, "
+              f"pressure {decision['pressure']}, trigger {decision['reason']} after {decision['waited_ms']} ms")
+        try:
+            mined = mine_block(wallet, scheduler.max_transactions, scheduler.max_bytes)
+        except Exception as e:
+            # One bad template must not stop the mining thread for good; wait for the mempool to change
+            print(f"Mining failed: {e}")
+            mined = None
+        scheduler.record(decision, mined)
+
+def allocate_wallet(port, balance, file_path="allocations.json"):
+    snapshots = SnapshotManager(f"data/{port}")
+    wallet_keys = snapshots.wallet_keys(snapshots.load())
+    wallet = Wallet(balance, keys=wallet_keys)
+    if wallet_keys is None:
+        snapshots.save_wallet(wallet)
+    try:
+        with open(file_path, 'r') as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        data = {}
+    data.setdefault("allocations", {})[wallet.get_address()] = balance
+    with open(file_path, 'w') as file:
+        json.dump(data, file, indent=4)
+    print(f"Allocated {balance} to the wallet of node {port} in {file_path}")
+    if os.path.exists(f"data/{port}/blocks.log"):
+        print(f"data/{port} already holds a chain. Remove it so the node starts from the new genesis block.")
+
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--allocate":
+        if len(sys.argv) != 4:
+            sys.exit("Usage: python3 app.py --allocate <PORT> <BALANCE>")
+        allocate_wallet(int(sys.argv[2]), float(sys.argv[3]))
+        sys.exit(0)
+    boot_started = time.time()
     port = 5000  
     wallet_balance = 100 
+    mining_workers = 1
+    max_block_transactions = 500
+    max_block_bytes = 256 * 1024
+    block_interval = 10.0
+    seen_filter_bits = 0
     if len(sys.argv) > 1:
         try:
             port = int(sys.argv[1])
@@ -370,9 +906,91 @@ if __name__ == "__main__":
                 raise ValueError("Wallet balance cannot be negative.")
         except ValueError:
             print("Invalid wallet balance provided. Using default (100)")
-    blockchain = BlockChain()
-    wallet = Wallet(wallet_balance)
-    blockchain.wallets[wallet.get_address()] = wallet_balance
+    if len(sys.argv) > 3:
+        try:
+            mining_workers = int(sys.argv[3])
+            if mining_workers < 1:
+                raise ValueError("Mining workers must be at least 1.")
+        except ValueError:
+            print("Invalid mining worker count provided. Using default (1)")
+            mining_workers = 1
+    if len(sys.argv) > 4:
+        try:
+            max_block_transactions = int(sys.argv[4])
+            if max_block_transactions < 1:
+                raise ValueError("Block transaction budget must be at least 1.")
+        except ValueError:
+            print("Invalid block transaction budget provided. Using default (500)")
+            max_block_transactions = 500
+    if len(sys.argv) > 5:
+        try:
+            max_block_bytes = int(sys.argv[5])
+            if max_block_bytes < 1024:
+                raise ValueError("Block byte budget must be at least 1024.")
+        except ValueError:
+            print("Invalid block byte budget provided. Using default (262144)")
+            max_block_bytes = 256 * 1024
+    if len(sys.argv) > 6:
+        try:
+            block_interval = float(sys.argv[6])
+            if block_interval <= 0:
+                raise ValueError("Block interval must be positive.")
+        except ValueError:
+            print("Invalid block interval provided. Using default (10 seconds)")
+            block_interval = 10.0
+    if len(sys.argv) > 7:
+        try:
+            seen_filter_bits = int(sys.argv[7])
+            if seen_filter_bits < 0:
+                raise ValueError("Seen filter size cannot be negative.")
+        except ValueError:
+            print("Invalid seen filter size provided. Using an exact seen cache")
+            seen_filter_bits = 0
+    if seen_filter_bits:
+        seen_transactions = SeenCache(bloom_bits=seen_filter_bits)
+    data_dir = f"data/{port}"
+    snapshots = SnapshotManager(data_dir)
+    snapshot = snapshots.load()
+    blockchain = BlockChain(
+        mining_workers=mining_workers,
+        data_dir=data_dir,
+        snapshot=snapshot,
+        genesis_cache="data/genesis.json",
+        block_interval=block_interval
+    )
+    # Advertise the nodes.json entry for this port, which is how peers list this node
+    node_address = next((node for node in blockchain.nodes if urlparse(node).port == port), f"http://localhost:{port}")
+    blockchain.peers.advertise(node_address)
+    wallet_keys = snapshots.wallet_keys(snapshot)
+    wallet = Wallet(wallet_balance, keys=wallet_keys)
+    if wallet_keys is None:
+        # Persist the new keypair at once, so the address can be listed in allocations.json before the next start
+        snapshots.save(blockchain, wallet)
+    # The opening balance comes only from this chain's genesis block, so spending down to 0 never re-mints it
+    allocation = blockchain.genesis_allocation(wallet.get_address())
+    if wallet_balance > 0 and not allocation:
+        message = (f"This wallet has no allocation in the genesis block. To start it with {wallet_balance}, run "
+                   f"'python3 app.py --allocate <PORT> <BALANCE>' for every node, then start them from fresh data "
+                   f"directories, or pass 0 as WALLET BALANCE. Address:\n{wallet.get_address()}")
+        if len(sys.argv) > 2:
+            sys.exit(message)
+        print(message)
+    elif allocation != wallet_balance and len(sys.argv) > 2:
+        print(f"Wallet balance comes from the genesis allocation of {allocation}, not WALLET BALANCE")
+    miner = MiningWorker(mining_workers)
+    miner.start()
+    block_validator = BlockValidator(blockchain)
+    scheduler = MiningScheduler(blockchain.mempool, max_block_transactions, max_block_bytes)
+    admission.start()
     threading.Thread(target=mine_blocks_periodically, daemon=True).start()
     threading.Thread(target=broadcast_wallet_details, daemon=True).start()
+    threading.Thread(target=snapshot_periodically, daemon=True).start()
+    boot_report = {
+        "time_to_ready_seconds": round(time.time() - boot_started, 3),
+        "snapshot_height": snapshot["height"] if snapshot and snapshot["height"] >= 0 else None,
+        "replayed_blocks": blockchain.replayed_blocks,
+        "chain_length": len(blockchain.chain)
+    }
+    print(f"Node ready in {boot_report['time_to_ready_seconds']:.3f} seconds "
+          f"(snapshot height: {boot_report['snapshot_height']}, replayed blocks: {boot_report['replayed_blocks']})")
     app.run(port=port)
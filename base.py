@@ -2,6 +2,8 @@ import hashlib
 import time
 import datetime
 import psutil
+from mining import MiningHasher, ParallelMiner
+from difficulty import difficulty_to_target
 class Block:
     def __init__(self, index, transactions, previous_hash):
         self.index = index  # Block number
@@ -11,22 +13,27 @@ class Block:
         self.nonce = 0
         self.hash = self.calculate_hash()
 
-    def calculate_hash(self):
-        block_contents = (
+    def header_prefix(self):
+        return (
             str(self.index) +
             str(self.timestamp) +
             str(self.transactions) +
-            str(self.previous_hash) +
-            str(self.nonce)
+            str(self.previous_hash)
         )
+
+    def calculate_hash(self):
+        block_contents = self.header_prefix() + str(self.nonce)
         return hashlib.sha256(block_contents.encode()).hexdigest()
-    def mine_block(self, difficulty):
+    def mine_block(self, difficulty, workers=1):
         target = '0' * difficulty
         start_time = time.time()
         cpu_usage_start = psutil.cpu_percent(interval=None)
+        if workers > 1:
+            ParallelMiner(workers).mine(self, difficulty_to_target(difficulty))
+        hash_nonce = MiningHasher(self.header_prefix()).hash_nonce
         while self.hash[:difficulty] != target:
             self.nonce += 1
-            self.hash = self.calculate_hash()  
+            self.hash = hash_nonce(self.nonce)
         end_time = time.time()
         cpu_usage_end = psutil.cpu_percent(interval=None)
         time_taken = end_time - start_time
@@ -34,16 +41,17 @@ class Block:
         print(f"Proof of Work completed. Time taken: {time_taken:.2f} seconds, CPU Utilization: {cpu_utilization}%")
 
 class BlockChain:
-	def __init__(self, difficulty = 4, confirmation_requirement = 0):
+	def __init__(self, difficulty = 4, confirmation_requirement = 0, mining_workers = 1):
 		self.chain = [Block(0, ["Genesis Block"], "0")]
 		self.difficulty = difficulty
+		self.mining_workers = mining_workers
 		self.confirmation_requirement = confirmation_requirement
 		self.pending_blocks = []
 	def get_latest_block(self):
 		return self.chain[-1]
 	def add_block(self, new_block):
 		new_block.previous_hash = self.get_latest_block().hash
-		new_block.mine_block(self.difficulty)
+		new_block.mine_block(self.difficulty, self.mining_workers)
 		self.pending_blocks.append(new_block)
 		while len(self.pending_blocks) > self.confirmation_requirement:
 			confirmed_block = self.pending_blocks.pop(0)
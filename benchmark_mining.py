@@ -0,0 +1,48 @@
+import sys
+import time
+from blockchain import Block, Wallet, Transaction
+from mining import MiningHasher
+
+
+def build_block(transaction_count):
+    sender = Wallet()
+    receiver = Wallet()
+    transactions = [
+        Transaction(sender, sender.get_address(), receiver.get_address(), i + 1).to_dict()
+        for i in range(transaction_count)
+    ]
+    return Block(1, transactions, "0" * 64)
+
+
+def full_rebuild_rate(block, attempts):
+    start_time = time.perf_counter()
+    for nonce in range(attempts):
+        block.nonce = nonce
+        block.calculate_hash()
+    return attempts / (time.perf_counter() - start_time)
+
+
+def prefix_hasher_rate(block, attempts):
+    start_time = time.perf_counter()
+    hash_nonce = MiningHasher(block.header_prefix()).hash_nonce
+    for nonce in range(attempts):
+        hash_nonce(nonce)
+    return attempts / (time.perf_counter() - start_time)
+
+
+def main():
+    attempts = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for transaction_count in (1, 10, 100, 500):
+        block = build_block(transaction_count)
+        block.nonce = 12345
+        expected = block.calculate_hash()
+        if MiningHasher(block.header_prefix()).hash_nonce(12345) != expected:
+            raise SystemExit("MiningHasher does not match Block.calculate_hash")
+        old_rate = full_rebuild_rate(block, attempts)
+        new_rate = prefix_hasher_rate(block, attempts)
+        print(f"{transaction_count:>4} transactions: calculate_hash {old_rate:>10.0f} H/s, "
+              f"MiningHasher {new_rate:>10.0f} H/s, speedup {new_rate / old_rate:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import json
+import sys
+import time
+from blockchain import Block, Wallet, Transaction
+from wire import decode_blocks, encode_blocks
+
+
+def build_chain(block_count, transactions_per_block):
+    wallets = [Wallet() for _ in range(4)]
+    blocks = []
+    previous_hash = "0" * 64
+    for index in range(block_count):
+        transactions = [
+            Transaction(
+                wallets[i % 4], wallets[i % 4].get_address(), wallets[(i + 1) % 4].get_address(), i + 1
+            ).to_dict()
+            for i in range(transactions_per_block)
+        ]
+        block = Block(index, transactions, previous_hash)
+        blocks.append(vars(block))
+        previous_hash = block.hash
+    return blocks
+
+
+def measure(encode, decode, rounds):
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        payload = encode()
+    encode_ms = (time.perf_counter() - start_time) * 1000 / rounds
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        decode(payload)
+    decode_ms = (time.perf_counter() - start_time) * 1000 / rounds
+    return len(payload), encode_ms, decode_ms
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for block_count, transactions_per_block in ((1, 10), (50, 10), (200, 25)):
+        blocks = build_chain(block_count, transactions_per_block)
+        if decode_blocks(encode_blocks(blocks, compress=True))[0] != blocks:
+            raise SystemExit("binary round trip does not reproduce the original blocks")
+        formats = {
+            "json": measure(
+                lambda: json.dumps({"length": len(blocks), "chain": blocks}).encode(), json.loads, rounds
+            ),
+            "binary": measure(lambda: encode_blocks(blocks), decode_blocks, rounds),
+            "binary+zlib": measure(lambda: encode_blocks(blocks, compress=True), decode_blocks, rounds),
+        }
+        json_size = formats["json"][0]
+        print(f"{block_count} blocks x {transactions_per_block} transactions:")
+        for name, (size, encode_ms, decode_ms) in formats.items():
+            print(f"  {name:<12} {size:>10} bytes ({size / json_size:>6.1%}), "
+                  f"encode {encode_ms:>8.2f} ms, decode {decode_ms:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
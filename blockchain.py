@@ -5,13 +5,27 @@ from urllib.parse import urlparse
 import requests
 import psutil
 import json
+import os
+import threading
 import rsa
 import rsa
 import requests
+from mining import MiningHasher, ParallelMiner
+from merkle import merkle_root, transaction_hash
+from header import header_hash, header_prefix
+from difficulty import RetargetPolicy, block_time, difficulty_to_target, meets_target
+from storage import ChainStore
+from peers import PeerClient
+from mempool import Mempool
+from signatures import has_unsigned_fields, transaction_message, verify_signature
+from state import LedgerState, block_transactions, is_coinbase
+from wire import CONTENT_TYPE, decode_blocks
+from verifier import ChainVerifier
+from chain_index import ChainIndex
 
 class Wallet:
-    def __init__(self, balance=100):
-        (self.public_key, self.private_key) = rsa.newkeys(512)
+    def __init__(self, balance=100, keys=None):
+        (self.public_key, self.private_key) = keys or rsa.newkeys(512)
         self.balance = balance
         self.is_registered = False
 
@@ -37,8 +51,9 @@ class Transaction:
         self.timestamp = time.time()
         self.signature = self.generate_signature()
     def generate_signature(self):
-        transaction_data = f"{self.sender}{self.receiver}{self.amount}{self.fee}{self.timestamp}"
-        return self.wallet.sign_transaction(transaction_data)
+        return self.wallet.sign_transaction(
+            transaction_message(self.sender, self.receiver, self.amount, self.fee, self.timestamp)
+        )
     def to_dict(self):
         return {
             "sender": self.sender,
@@ -49,96 +64,304 @@ class Transaction:
             "signature": self.signature.hex() if self.signature else None
         }
     def validate_transaction(self, blockchain):
-        sender_balance = blockchain.get_wallet_balance(self.sender)
-        if sender_balance < self.amount:
+        sender_balance = blockchain.spendable_balance(self.sender)
+        if sender_balance < self.amount + self.fee:
             print(f"Transaction validation failed: Insufficient balance for {self.sender}")
             return False
 
         try:
-            data_to_sign = f"{self.sender}{self.receiver}{self.amount}{self.fee}{self.timestamp}"
-            signature_hex = self.signature.hex() 
-            rsa.verify(data_to_sign.encode(), bytes.fromhex(signature_hex), rsa.PublicKey.load_pkcs1(self.sender))
-            return True
-        except rsa.VerificationError:
+            data_to_sign = transaction_message(self.sender, self.receiver, self.amount, self.fee, self.timestamp)
+            return verify_signature(self.sender, data_to_sign, self.signature)
+        except (rsa.VerificationError, TypeError, ValueError):
             print("Transaction validation failed: Invalid signature.")
             return False
 
 
 
+SYNC_WINDOW = 16
+
+
 class Block:
-    def __init__(self, index, transactions, previous_hash):
+    def __init__(self, index, transactions, previous_hash, target=None):
         self.index = index
         self.timestamp = datetime.datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S')
         self.transactions = transactions
+        self.merkle_root = merkle_root(transactions)
         self.previous_hash = previous_hash
+        self.target = target
         self.nonce = 0
         self.hash = self.calculate_hash()
 
+    def header_prefix(self):
+        return header_prefix(self.index, self.timestamp, self.merkle_root, self.previous_hash, self.target)
+
+    def header(self):
+        return {
+            "index": self.index,
+            "timestamp": self.timestamp,
+            "merkle_root": self.merkle_root,
+            "previous_hash": self.previous_hash,
+            "target": self.target,
+            "nonce": self.nonce,
+            "hash": self.hash
+        }
+
     def calculate_hash(self):
-        block_string = f"{self.index}{self.timestamp}{self.transactions}{self.previous_hash}{self.nonce}"
+        block_string = f"{self.header_prefix()}{self.nonce}"
         return hashlib.sha256(block_string.encode()).hexdigest()
 
 
-    def mine_block(self, difficulty):
-        target = '0' * difficulty
-        while self.hash[:difficulty] != target:
+    def mine_block(self, target, workers=1):
+        if workers > 1:
+            return ParallelMiner(workers).mine(self, target)
+        hash_nonce = MiningHasher(self.header_prefix()).hash_nonce
+        while not meets_target(self.hash, target):
             self.nonce += 1
-            self.hash = self.calculate_hash()
+            self.hash = hash_nonce(self.nonce)
         return self.hash
 
 class BlockChain:
-    def __init__(self, difficulty=4, confirmation_requirement=0):
+    def __init__(self, difficulty=4, confirmation_requirement=0, mining_workers=1, data_dir=None,
+                 mempool_max_count=50000, mempool_max_bytes=32 * 1024 * 1024, snapshot=None, genesis_cache=None,
+                 block_interval=10.0, retarget_interval=10, allocations=None):
         self.difficulty = difficulty
-        self.chain = [self.create_genesis_block()]
+        self.allocations = self.load_allocations_from_file() if allocations is None else allocations
+        self.retarget = RetargetPolicy(difficulty_to_target(difficulty), block_interval, retarget_interval)
+        self.mining_workers = mining_workers
+        self.genesis_cache = genesis_cache
+        self.lock = threading.RLock()
+        self.verifier = ChainVerifier(self.retarget, os.path.join(data_dir, "verified.json") if data_dir else None)
+        if data_dir:
+            self.chain = ChainStore(data_dir, self.deserialize_block)
+            if not len(self.chain):
+                self.chain.append(self.create_genesis_block())
+            elif self.chain[0].transactions != self.genesis_transactions():
+                print(f"Stored genesis block in {data_dir} does not match the configured allocations. "
+                      f"Remove the data directory to start a chain with the new allocations.")
+        else:
+            self.chain = [self.create_genesis_block()]
         self.confirmation_requirement = confirmation_requirement
         self.pending_blocks = []
-        self.mempool = []
-        self.wallets = {}  
+        self.last_fork_height = None
+        self.mempool = Mempool(mempool_max_count, mempool_max_bytes)
+        self.state = LedgerState()
+        self.index = ChainIndex()
+        self.replayed_blocks = 0
+        if not (snapshot and self.restore_snapshot(snapshot)):
+            self.state.rebuild(self.chain)
+            self.replayed_blocks = len(self.chain)
         self.nodes = set()
+        self.peers = PeerClient()
         self.load_nodes_from_file()
+    def load_allocations_from_file(self, file_path="allocations.json"):
+        try:
+            with open(file_path, 'r') as file:
+                return json.load(file).get("allocations", {})
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            print(f"Error decoding {file_path}: {e}")
+            return {}
+    def genesis_transactions(self):
+        if not self.allocations:
+            return "Genesis Block"
+        return [
+            {"sender": "System", "receiver": address, "amount": amount, "fee": 0, "signature": None, "timestamp": 0}
+            for address, amount in sorted(self.allocations.items())
+        ]
+    def genesis_allocation(self, address):
+        return sum(
+            txn["amount"] for txn in block_transactions(self.chain[0])
+            if is_coinbase(txn) and txn["receiver"] == address
+        )
     def create_genesis_block(self):
-        genesis_block = Block(0, "Genesis Block", "0")
+        genesis_block = self.load_cached_genesis()
+        if genesis_block:
+            return genesis_block
+        genesis_block = Block(0, self.genesis_transactions(), "0")
         genesis_block.timestamp = 0 
-        genesis_block.mine_block(self.difficulty)
+        genesis_block.hash = genesis_block.calculate_hash()
+        genesis_block.mine_block(self.retarget.initial_target)
+        self.save_cached_genesis(genesis_block)
         return genesis_block
+    def load_cached_genesis(self):
+        if not self.genesis_cache:
+            return None
+        try:
+            with open(self.genesis_cache, 'r') as file:
+                block_data = json.load(file).get(str(self.difficulty))
+            if not block_data:
+                return None
+            genesis_block = self.deserialize_block(block_data)
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError):
+            return None
+        if genesis_block.hash != genesis_block.calculate_hash() or not meets_target(genesis_block.hash, self.retarget.initial_target):
+            return None
+        if genesis_block.transactions != self.genesis_transactions():
+            return None
+        return genesis_block
+    def save_cached_genesis(self, genesis_block):
+        if not self.genesis_cache:
+            return
+        try:
+            with open(self.genesis_cache, 'r') as file:
+                cache = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            cache = {}
+        cache[str(self.difficulty)] = vars(genesis_block)
+        os.makedirs(os.path.dirname(self.genesis_cache) or ".", exist_ok=True)
+        with open(self.genesis_cache, 'w') as file:
+            json.dump(cache, file)
+    def restore_snapshot(self, snapshot):
+        height = snapshot["height"]
+        if height < 0:
+            # Only the wallet was saved, by app.py --allocate before the node held any chain
+            return False
+        if height >= len(self.chain) or self.chain[height].hash != snapshot["tip_hash"]:
+            print("Snapshot does not match the stored chain. Rebuilding state from genesis.")
+            return False
+        self.state.restore(snapshot["balances"], height, snapshot["tip_hash"])
+        replayed = self.chain[height + 1:]
+        for block in replayed:
+            self.state.apply_block(block)
+        for txn in snapshot.get("mempool", []):
+            self.mempool.add(txn)
+        for block in replayed:
+            self.mempool.remove(block_transactions(block))
+        self.replayed_blocks = len(replayed)
+        print(f"State restored from snapshot at height {height}. Replayed {len(replayed)} blocks.")
+        return True
     def get_wallet_balance(self, wallet_address):
-        return self.wallets.get(wallet_address, 0)
+        return self.state.get_balance(wallet_address)
+    def spendable_balance(self, wallet_address):
+        return self.state.get_balance(wallet_address) - self.mempool.pending_spend(wallet_address)
+    @property
+    def wallets(self):
+        return self.state.balances
+    def block_hash_at(self, height):
+        if isinstance(self.chain, ChainStore):
+            return self.chain.hash_at(height)
+        return self.chain[height].hash
+    def chain_index(self):
+        with self.lock:
+            if not self.index.built:
+                self.index.build(self.chain)
+        return self.index
+    def get_block_by_hash(self, block_hash):
+        height = self.chain_index().height_of(block_hash)
+        return None if height is None else self.chain[height]
+    def locate_transaction(self, txid):
+        with self.lock:
+            location = self.chain_index().locate(txid)
+            if location is None:
+                return None
+            height, position = location
+            block = self.chain[height]
+            return block, position, block.transactions[position]
+    def address_history(self, address, offset=0, limit=50, newest_first=True):
+        with self.lock:
+            postings, total = self.chain_index().address_history(address, offset, limit, newest_first)
+            entries = []
+            for height, position, txid in postings:
+                block = self.chain[height]
+                entries.append({
+                    "txid": txid,
+                    "block_height": height,
+                    "block_hash": block.hash,
+                    "position": position,
+                    "transaction": block.transactions[position]
+                })
+            return entries, total
     def get_latest_block(self):
         return self.chain[-1]
+    def next_target(self):
+        with self.lock:
+            return self.retarget.expected_target(len(self.chain), self.chain.__getitem__)
+    def difficulty_stats(self):
+        with self.lock:
+            height = len(self.chain) - 1
+            first = max(height - self.retarget.retarget_interval, 1)
+            recent_interval = None
+            if height > first:
+                span = block_time(self.chain[height].timestamp) - block_time(self.chain[first].timestamp)
+                recent_interval = round(span / (height - first), 3)
+            next_target = self.next_target()
+        return {
+            "initial_target": self.retarget.initial_target,
+            "next_target": next_target,
+            "relative_difficulty": round(int(self.retarget.initial_target, 16) / int(next_target, 16), 4),
+            "block_interval_seconds": self.retarget.block_interval,
+            "recent_block_interval_seconds": recent_interval,
+            "retarget_interval": self.retarget.retarget_interval
+        }
     def add_to_mempool(self, transaction):
-        if transaction not in self.mempool:
-            self.mempool.append(transaction)
+        txid = self.mempool.add(transaction)
+        if txid:
             print(f"Transaction added to mempool. Mempool size: {len(self.mempool)}")
+        return txid
     def remove_from_mempool(self, transactions):
-        self.mempool = [txn for txn in self.mempool if txn not in transactions]
+        self.mempool.remove(transactions)
         print(f"Mempool updated. Current size: {len(self.mempool)}")
     def mine_block(self):
         if not self.mempool:
             print("Mempool is empty. Nothing to mine.")
             return None
-        transactions_to_mine = self.mempool[:]
+        transactions_to_mine = self.mempool.to_list()
         new_block = Block(
             index=len(self.chain),
             transactions=transactions_to_mine,
-            previous_hash=self.get_latest_block().hash
+            previous_hash=self.get_latest_block().hash,
+            target=self.next_target()
         )
 
-        new_block.mine_block(self.difficulty)
+        new_block.mine_block(new_block.target, self.mining_workers)
         self.add_block(new_block)
         self.remove_from_mempool(transactions_to_mine)
         print(f"Block mined and added to the chain. Block index: {new_block.index}")
         return new_block
 
-    def add_block(self, new_block):
-        for txn in new_block.transactions:
-            if txn.get("sender") != "System":
-                self.wallets[txn["sender"]] = self.wallets.get(txn["sender"], 0) - txn["amount"]
-            self.wallets[txn["receiver"]] = self.wallets.get(txn["receiver"], 0) + txn["amount"]
+    def select_transactions(self, max_count, max_bytes=None):
+        with self.lock:
+            index = self.chain_index()
+            candidates = []
+            stale = []
+            for txn in self.mempool.select(max_count, max_bytes):
+                if has_unsigned_fields(txn) or index.locate(transaction_hash(txn)) is not None:
+                    stale.append(txn)
+                else:
+                    candidates.append(txn)
+            if stale:
+                self.mempool.remove(stale)
+            # Overspends stay in the mempool, since an incoming payment may fund them later
+            return self.state.spendable(candidates)
+
+    def check_block(self, block):
+        self.state.check_block(block)
+        index = self.chain_index()
+        txids = set()
+        for txn in block_transactions(block):
+            if has_unsigned_fields(txn):
+                raise ValueError(f"Transaction from {txn.get('sender')} carries unsigned fields")
+            txid = transaction_hash(txn)
+            if txid in txids:
+                raise ValueError(f"Transaction {txid} appears twice in the block")
+            if index.locate(txid) is not None:
+                raise ValueError(f"Transaction {txid} is already in the chain")
+            txids.add(txid)
+
+    def _append_block(self, block):
+        self.chain.append(block)
+        self.state.apply_block(block)
+        self.index.add_block(block)
+
+    def add_block(self, new_block, check_balances=False):
+        if check_balances:
+            self.check_block(new_block)
         self.pending_blocks.append(new_block)
         confirmed_blocks = []
         while len(self.pending_blocks) > self.confirmation_requirement:
             confirmed_block = self.pending_blocks.pop(0)
-            self.chain.append(confirmed_block)
+            self._append_block(confirmed_block)
             confirmed_blocks.append(confirmed_block)
             print(f"Block confirmed. Index: {confirmed_block.index}, Hash: {confirmed_block.hash}")
         if confirmed_blocks:
@@ -156,34 +379,143 @@ class BlockChain:
         except json.JSONDecodeError as e:
             print(f"Error decoding {file_path}: {e}")
 
-    def validate_chain(self, chain):
-        for i in range(1, len(self.chain)):
-            current_block = self.chain[i]
-            previous_block = self.chain[i - 1]
-            if current_block.previous_hash != previous_block.hash:
+    def validate_headers(self, headers, parent):
+        parent_index, parent_hash = parent.index, parent.hash
+
+        def block_at(height):
+            return headers[height - parent.index - 1] if height > parent.index else self.chain[height]
+
+        for header in headers:
+            if header['index'] != parent_index + 1 or header['previous_hash'] != parent_hash:
                 return False
-            if not current_block.hash.startswith('0' * self.difficulty):
+            if header_hash(header) != header['hash']:
                 return False
+            error = self.retarget.check(header, header['index'], block_at)
+            if error:
+                print(f"Header {header['index']} rejected: {error}")
+                return False
+            parent_index, parent_hash = header['index'], header['hash']
         return True
 
+    def fetch_range(self, node, path, start, end=None):
+        items = []
+        while True:
+            params = {"from": start + len(items)}
+            if end is not None:
+                params["to"] = end
+            if path == "blocks":
+                params["compress"] = 1
+            response = self.peers.get(
+                f"{node}/{path}", params=params, headers={"Accept": f"{CONTENT_TYPE}, application/json"}
+            )
+            response.raise_for_status()
+            if response.headers.get("Content-Type", "").startswith(CONTENT_TYPE):
+                batch, length = decode_blocks(response.content)
+            else:
+                data = response.json()
+                batch, length = data[path], data['length']
+            items.extend(batch)
+            last = end if end is not None else length - 1
+            if not batch or start + len(items) > last:
+                return items, length
+
+    def find_fork_point(self, node):
+        local_length = len(self.chain)
+        window = SYNC_WINDOW
+        while True:
+            start = max(local_length - window, 0)
+            headers, remote_length = self.fetch_range(node, "headers", start)
+            if remote_length <= local_length:
+                return None
+            for height in range(min(local_length, start + len(headers)) - 1, start - 1, -1):
+                if headers[height - start]['hash'] == self.chain[height].hash:
+                    return height, headers[height - start + 1:]
+            if start == 0:
+                raise ValueError("no common ancestor with local chain")
+            window *= 2
+
+    def download_blocks(self, node, headers):
+        bodies, _ = self.fetch_range(node, "blocks", headers[0]['index'], headers[-1]['index'])
+        if len(bodies) != len(headers):
+            raise ValueError("incomplete block download")
+        blocks = []
+        for header, body in zip(headers, bodies):
+            block = self.deserialize_block(body)
+            if block.hash != header['hash'] or block.calculate_hash() != block.hash:
+                raise ValueError(f"Block {block.index} does not match its header")
+            blocks.append(block)
+        return blocks
+
     def resolve_conflicts(self):
-        neighbors = self.nodes
-        new_chain = None
-        max_length = len(self.chain)
-
-        for node in neighbors:
-            response = requests.get(f'{node}/chain')
-            if response.status_code == 200:
-                length = response.json()['length']
-                chain = response.json()['chain']
-                if length > max_length and self.validate_chain(chain):
-                    max_length = length
-                    new_chain = chain
-        if new_chain:
-            self.chain = [self.deserialize_block(b) for b in new_chain]
-            return True
+        candidates = []
+        forks = self.peers.gather(self.nodes, self.find_fork_point)
+        for node, fork in forks.items():
+            if isinstance(fork, Exception):
+                print(f"Header sync with {node} failed: {fork}")
+                continue
+            if fork is None:
+                continue
+            ancestor, headers = fork
+            length = ancestor + 1 + len(headers)
+            if length <= len(self.chain):
+                continue
+            try:
+                if self.validate_headers(headers, self.chain[ancestor]):
+                    candidates.append((length, node, ancestor, headers))
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Headers from {node} are malformed: {e}")
+        # A peer that cannot serve a valid chain only costs its own attempt; the next longest is tried
+        for _, node, ancestor, headers in sorted(candidates, key=lambda candidate: candidate[0], reverse=True):
+            if self.adopt_fork(node, ancestor, headers):
+                return True
         return False
 
+    def adopt_fork(self, node, ancestor, headers):
+        try:
+            blocks = self.download_blocks(node, headers)
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+            print(f"Block download from {node} failed: {e}")
+            return False
+        result = self.verifier.verify_blocks(
+            blocks, parent=self.chain[ancestor],
+            block_at=lambda height: blocks[height - ancestor - 1] if height > ancestor else self.chain[height]
+        )
+        if not result["valid"]:
+            print(f"Candidate chain from {node} rejected at block {result['index']}: {result['error']}")
+            return False
+        with self.lock:
+            if len(self.chain) <= ancestor or self.chain[ancestor].hash != headers[0]['previous_hash']:
+                return False
+            if ancestor + 1 + len(blocks) <= len(self.chain):
+                return False
+            orphaned = self.chain[ancestor + 1:]
+            if not self.state.rollback_to(ancestor):
+                self.state.rebuild(self.chain[:ancestor + 1])
+            del self.chain[ancestor + 1:]
+            self.verifier.rewind(ancestor, self.chain[ancestor].hash)
+            self.index.truncate(ancestor + 1)
+            try:
+                for block in blocks:
+                    self.check_block(block)
+                    self._append_block(block)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Candidate chain from {node} rejected at block {block.index}: {e}")
+                if not self.state.rollback_to(ancestor):
+                    self.state.rebuild(self.chain[:ancestor + 1])
+                del self.chain[ancestor + 1:]
+                self.index.truncate(ancestor + 1)
+                for orphan in orphaned:
+                    self._append_block(orphan)
+                return False
+            self.last_fork_height = ancestor
+            for block in orphaned:
+                for txn in block_transactions(block):
+                    self.mempool.add(txn)
+            for block in blocks:
+                self.mempool.remove(block_transactions(block))
+        print(f"Chain replaced from {node}. Fork height: {ancestor}, blocks downloaded: {len(blocks)}")
+        return True
+
     def deserialize_block(self, block_data):
         block = Block(
             index=block_data['index'],
@@ -191,7 +523,10 @@ class BlockChain:
             previous_hash=block_data['previous_hash']
         )
         block.timestamp = block_data.get('timestamp', block.timestamp)
+        block.target = block_data.get('target')
         block.hash = block_data['hash']
         block.nonce = block_data['nonce']
+        if block_data.get('merkle_root', block.merkle_root) != block.merkle_root:
+            raise ValueError(f"Merkle root mismatch in block {block.index}")
 
         return block
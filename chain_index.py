@@ -0,0 +1,83 @@
+import threading
+from merkle import transaction_hash
+from state import block_transactions
+
+
+class ChainIndex:
+    def __init__(self):
+        self.built = False
+        self._height_by_hash = {}
+        self._locations = {}
+        self._postings = {}
+        self._blocks = []
+        self._lock = threading.RLock()
+
+    def build(self, blocks):
+        with self._lock:
+            self._height_by_hash = {}
+            self._locations = {}
+            self._postings = {}
+            self._blocks = []
+            self.built = True
+            for block in blocks:
+                self.add_block(block)
+
+    def add_block(self, block):
+        with self._lock:
+            if not self.built:
+                return
+            height = len(self._blocks)
+            transactions = block_transactions(block)
+            txids = [transaction_hash(txn) for txn in transactions]
+            addresses = set()
+            self._height_by_hash[block.hash] = height
+            for position, (txn, txid) in enumerate(zip(transactions, txids)):
+                self._locations.setdefault(txid, (height, position))
+                for address in {txn.get("sender"), txn.get("receiver")}:
+                    if isinstance(address, str):
+                        self._postings.setdefault(address, []).append((height, position, txid))
+                        addresses.add(address)
+            self._blocks.append((block.hash, txids, addresses))
+
+    def truncate(self, height):
+        with self._lock:
+            if not self.built:
+                return
+            while len(self._blocks) > height:
+                removed_height = len(self._blocks) - 1
+                block_hash, txids, addresses = self._blocks.pop()
+                self._height_by_hash.pop(block_hash, None)
+                for txid in txids:
+                    if self._locations.get(txid, (None,))[0] == removed_height:
+                        del self._locations[txid]
+                for address in addresses:
+                    postings = self._postings[address]
+                    while postings and postings[-1][0] == removed_height:
+                        postings.pop()
+                    if not postings:
+                        del self._postings[address]
+
+    def height_of(self, block_hash):
+        return self._height_by_hash.get(block_hash)
+
+    def locate(self, txid):
+        return self._locations.get(txid)
+
+    def address_history(self, address, offset=0, limit=50, newest_first=True):
+        with self._lock:
+            postings = self._postings.get(address, [])
+            total = len(postings)
+            if newest_first:
+                end = max(total - offset, 0)
+                page = postings[max(end - limit, 0):end][::-1]
+            else:
+                page = postings[offset:offset + limit]
+            return page, total
+
+    def stats(self):
+        return {
+            "built": self.built,
+            "blocks": len(self._blocks),
+            "transactions": len(self._locations),
+            "addresses": len(self._postings)
+        }
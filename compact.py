@@ -0,0 +1,56 @@
+import hashlib
+from merkle import transaction_hash
+from state import is_coinbase
+
+SHORT_ID_BYTES = 6
+HEADER_FIELDS = ("index", "timestamp", "merkle_root", "previous_hash", "target", "nonce", "hash")
+
+
+def short_id(block_hash, txid):
+    # Salting with the block hash keeps short IDs from colliding the same way in every block
+    return hashlib.sha256(f"{block_hash}:{txid}".encode()).hexdigest()[:SHORT_ID_BYTES * 2]
+
+
+def compact_block(block_data, prefill=()):
+    transactions = block_data["transactions"]
+    prefill = set(prefill)
+    prefilled = {}
+    short_ids = []
+    for position, txn in enumerate(transactions):
+        if position in prefill or is_coinbase(txn):
+            prefilled[str(position)] = txn
+            short_ids.append(None)
+        else:
+            short_ids.append(short_id(block_data["hash"], transaction_hash(txn)))
+    return {
+        "header": {field: block_data.get(field) for field in HEADER_FIELDS},
+        "short_ids": short_ids,
+        "prefilled": prefilled
+    }
+
+
+def reconstruct_block(compact, mempool):
+    header = compact["header"]
+    short_ids = compact["short_ids"]
+    prefilled = {int(position): txn for position, txn in compact.get("prefilled", {}).items()}
+    wanted = {sid for sid in short_ids if sid is not None}
+    candidates = {}
+    for txid in mempool.txids():
+        sid = short_id(header["hash"], txid)
+        if sid in wanted:
+            candidates[sid] = None if sid in candidates else txid
+    transactions = []
+    missing = []
+    for position, sid in enumerate(short_ids):
+        if position in prefilled:
+            transactions.append(prefilled[position])
+            continue
+        txn = mempool.get(candidates.get(sid)) if sid is not None else None
+        if txn is None:
+            missing.append(position)
+        transactions.append(txn)
+    if missing:
+        return None, missing
+    block_data = dict(header)
+    block_data["transactions"] = transactions
+    return block_data, []
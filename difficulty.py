@@ -0,0 +1,67 @@
+import datetime
+
+MAX_TARGET = (1 << 256) - 1
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def format_target(value):
+    return f"{min(max(value, 1), MAX_TARGET):064x}"
+
+
+def difficulty_to_target(difficulty):
+    return format_target(MAX_TARGET >> (4 * difficulty))
+
+
+def meets_target(block_hash, target):
+    # Both are 64-character lowercase hex strings, so string order is numeric order
+    return block_hash <= target
+
+
+def block_time(timestamp):
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    return datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp()
+
+
+def _field(block, name):
+    return block.get(name) if isinstance(block, dict) else getattr(block, name, None)
+
+
+class RetargetPolicy:
+    def __init__(self, initial_target, block_interval=10.0, retarget_interval=10, max_adjustment=4):
+        self.initial_target = initial_target
+        self.block_interval = block_interval
+        self.retarget_interval = retarget_interval
+        self.max_adjustment = max_adjustment
+        self.easiest_target = int(initial_target, 16) * max_adjustment
+
+    def effective_target(self, block):
+        return _field(block, "target") or self.initial_target
+
+    def expected_target(self, height, block_at):
+        if height <= 1:
+            return self.initial_target
+        previous_target = self.effective_target(block_at(height - 1))
+        if height % self.retarget_interval:
+            return previous_target
+        # The genesis timestamp is fixed at 0, so the window never reaches back past block 1
+        first = max(height - self.retarget_interval, 1)
+        if height - 1 <= first:
+            return previous_target
+        actual = block_time(_field(block_at(height - 1), "timestamp")) - block_time(_field(block_at(first), "timestamp"))
+        expected = (height - 1 - first) * self.block_interval
+        actual = min(max(actual, expected / self.max_adjustment), expected * self.max_adjustment)
+        adjusted = int(previous_target, 16) * int(actual * 1000) // int(expected * 1000)
+        return format_target(min(adjusted, self.easiest_target))
+
+    def check(self, block, height, block_at):
+        target = self.effective_target(block)
+        try:
+            expected = self.expected_target(height, block_at)
+        except (TypeError, ValueError) as e:
+            return f"Cannot compute the expected target from block timestamps: {e}"
+        if target != expected:
+            return f"Block target {target} does not match the expected target {expected}"
+        if not meets_target(_field(block, "hash"), target):
+            return "Block hash does not satisfy proof-of-work"
+        return None
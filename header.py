@@ -0,0 +1,14 @@
+import hashlib
+
+
+def header_prefix(index, timestamp, merkle_root, previous_hash, target=None):
+    prefix = f"{index}{timestamp}{merkle_root}{previous_hash}"
+    # Blocks mined before retargeting carry no target, and their hashes do not commit to one
+    return prefix if target is None else f"{prefix}{target}"
+
+
+def header_hash(header):
+    prefix = header_prefix(
+        header['index'], header['timestamp'], header['merkle_root'], header['previous_hash'], header.get('target')
+    )
+    return hashlib.sha256(f"{prefix}{header['nonce']}".encode()).hexdigest()
@@ -3,6 +3,15 @@ import json
 from pprint import pprint
 import time
 import random 
+import sys
+from urllib.parse import quote
+from header import header_hash
+from merkle import transaction_hash, verify_merkle_proof
+from difficulty import difficulty_to_target, meets_target
+
+LIGHT_DIFFICULTY = 4
+LIGHT_SYNC_WINDOW = 16
+LIGHT_MAX_ADJUSTMENT = 4
 def get_node_address():
     print("Enter the address of the node you want to connect to (e.g., http://127.0.0.1:5000):")
     return input("Node address: ").strip()
@@ -72,6 +81,7 @@ def display_wallet_details():
                     print(f"Node: {node_address}")
                     print(f"  Public Key: {public_key}")
                     print(f"  Balance: {balance}")
+                    display_address_history(node_address, public_key, limit=5)
                 else:
                     print(f"Failed to fetch wallet details from {node_address}")
             except requests.exceptions.RequestException as e:
@@ -83,14 +93,39 @@ def display_wallet_details():
     except json.JSONDecodeError:
         print("Failed to parse nodes.json. Please ensure it is in valid JSON format.")
 
+def short_address(address):
+    lines = address.strip().splitlines()
+    return f"{lines[1][:24]}..." if len(lines) > 2 else address
+
+
+def display_address_history(node_address, address, limit=10):
+    response = requests.get(
+        f"{node_address}/address/{quote(address, safe='')}/transactions", params={"limit": limit}
+    )
+    if response.status_code != 200:
+        print(f"Failed to retrieve transaction history. Status code: {response.status_code}")
+        return
+    history = response.json()
+    print(f"Recent transactions ({len(history['transactions'])} of {history['total']}):")
+    for entry in history["transactions"]:
+        transaction = entry["transaction"]
+        if entry["direction"] == "sent":
+            counterparty = f"to {short_address(transaction['receiver'])}"
+        else:
+            counterparty = f"from {short_address(transaction['sender'])}"
+        print(f"  Block {entry['block_height']}: {entry['direction']} {transaction['amount']} {counterparty} "
+              f"(txid {entry['txid'][:16]})")
+
+
 def display_my_wallet_details(node_address):
     try:
         response = requests.post(f"{node_address}/wallet")
         if response.status_code == 200:
-            wallets = response.json()
+            wallet_details = response.json()
             print("Wallet Details from Node:")
-            for wallet, balance in wallets.items():
-                print(f"Wallet Address: {wallet}, Balance: {balance}")
+            print(f"Wallet Address: {wallet_details['public_key']}")
+            print(f"Balance: {wallet_details['balance']}")
+            display_address_history(node_address, wallet_details["public_key"])
         else:
             print(f"Failed to retrieve wallet details from {node_address}. Status code: {response.status_code}")
     except requests.exceptions.RequestException as e:
@@ -176,6 +211,7 @@ def resolve_chain(node_address):
             result = response.json()
             print(result.get('message', 'No message provided'))
             if "new_chain" in result:
+                print(f"Replaced blocks above fork height {result.get('fork_height', 'N/A')}:")
                 for block in result["new_chain"]:
                     print("**************************************")
                     print(f"Index: {block.get('index', 'N/A')}, "
@@ -214,6 +250,7 @@ def display_blockchain_state(node_address):
             print(f"Index: {block['index']}")
             print(f"Timestamp: {block['timestamp']}")
             print(f"Transactions: {block['transactions']}")
+            print(f"Merkle Root: {block.get('merkle_root', 'N/A')}")
             print(f"Previous Hash: {block['previous_hash']}")
             print(f"Hash: {block['hash']}")
             print(f"Nonce: {block['nonce']}")
@@ -241,6 +278,44 @@ def verify_blockchain_integrity(node_address):
     print("--------------------------------------")
 
 
+def lookup_block_or_transaction(node_address):
+    query = input("Enter a block hash, block height or transaction ID: ").strip()
+    if not query:
+        print("Error: Nothing to look up!")
+        return
+    try:
+        if query.isdigit():
+            response = requests.get(f"{node_address}/block/height/{query}")
+        else:
+            response = requests.get(f"{node_address}/block/{query}")
+            if response.status_code == 404:
+                response = requests.get(f"{node_address}/tx/{query}")
+        if response.status_code != 200:
+            print(f"Not found: {response.json().get('error', response.status_code)}")
+            return
+        data = response.json()
+        print("**************************************")
+        if "transaction" in data:
+            print(f"Transaction ID: {data['txid']}")
+            print(f"Status: {data['status']}")
+            if data["status"] == "confirmed":
+                print(f"Block: {data['block_height']} ({data['block_hash']})")
+                print(f"Position in block: {data['position']}")
+                print(f"Confirmations: {data['confirmations']}")
+            print(f"Transaction: {data['transaction']}")
+        else:
+            print(f"Index: {data['index']}")
+            print(f"Timestamp: {data['timestamp']}")
+            print(f"Transactions: {data['transactions']}")
+            print(f"Merkle Root: {data.get('merkle_root', 'N/A')}")
+            print(f"Previous Hash: {data['previous_hash']}")
+            print(f"Hash: {data['hash']}")
+            print(f"Nonce: {data['nonce']}")
+        print("**************************************")
+    except requests.exceptions.RequestException as e:
+        print(f"Error: {e}")
+
+
 def simulate_pinning_attack(node_address, sender_wallet_address):
     try:
         nodes_wallets = get_all_nodes_wallets()
@@ -298,12 +373,113 @@ def simulate_pinning_attack(node_address, sender_wallet_address):
         print(f"Error during attack simulation: {e}")
 
 
+def check_light_header(header, parent, difficulty=LIGHT_DIFFICULTY):
+    initial_target = difficulty_to_target(difficulty)
+    target = header.get("target") or initial_target
+    if header_hash(header) != header["hash"]:
+        return "hash does not match the header"
+    if int(target, 16) > int(initial_target, 16) * LIGHT_MAX_ADJUSTMENT:
+        return "target is easier than the network allows"
+    if not meets_target(header["hash"], target):
+        return "hash does not satisfy proof-of-work"
+    if parent is None and header["index"] != 0:
+        return "first header is not the genesis block"
+    if parent is not None and (header["previous_hash"] != parent["hash"] or header["index"] != parent["index"] + 1):
+        return "header does not link to the previous header"
+    return None
+
+
+def sync_light_headers(node_address, headers):
+    window = LIGHT_SYNC_WINDOW
+    while True:
+        response = requests.get(f"{node_address}/headers", params={"from": len(headers)}, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        batch = data["headers"]
+        if batch and headers and batch[0]["previous_hash"] != headers[-1]["hash"]:
+            # The node switched to another fork below our tip, so step back and fetch again
+            dropped = min(window, len(headers) - 1)
+            if not dropped:
+                raise ValueError("node has a different genesis block")
+            del headers[-dropped:]
+            window *= 2
+            continue
+        for header in batch:
+            error = check_light_header(header, headers[-1] if headers else None)
+            if error:
+                raise ValueError(f"Header {header.get('index')} rejected: {error}")
+            headers.append(header)
+        if not batch or len(headers) >= data["length"]:
+            return
+
+
+def verify_light_payment(node_address, headers, txid):
+    response = requests.get(f"{node_address}/proof/{txid}", timeout=10)
+    if response.status_code == 404:
+        return None, "not confirmed in a block yet"
+    response.raise_for_status()
+    proof = response.json()
+    height = proof["block_height"]
+    if height >= len(headers):
+        sync_light_headers(node_address, headers)
+    if height >= len(headers) or headers[height]["hash"] != proof["header"]["hash"]:
+        return None, "proof refers to a block outside the synced header chain"
+    if transaction_hash(proof["transaction"]) != txid:
+        return None, "returned transaction does not match its ID"
+    if not verify_merkle_proof(txid, proof["proof"], headers[height]["merkle_root"]):
+        return None, "Merkle proof does not match the block header"
+    return proof, f"confirmed in block {height} with {len(headers) - height} confirmations"
+
+
+def verify_light_payments(node_address, headers, wallet_address, limit=10):
+    sync_light_headers(node_address, headers)
+    response = requests.get(
+        f"{node_address}/address/{quote(wallet_address, safe='')}/transactions", params={"limit": limit}, timeout=10
+    )
+    response.raise_for_status()
+    for entry in response.json()["transactions"]:
+        proof, status = verify_light_payment(node_address, headers, entry["txid"])
+        marker = "OK " if proof else "BAD"
+        amount = proof["transaction"]["amount"] if proof else entry["transaction"].get("amount")
+        print(f"  [{marker}] txid {entry['txid'][:16]} amount {amount}: {status}")
+
+
+def light_mode(node_address, wallet_address):
+    headers = []
+    while True:
+        print(f"Light client ({len(headers)} headers synced)")
+        print("1. Sync block headers")
+        print("2. Verify my payments")
+        print("3. Verify a transaction by ID")
+        print("4. Exit")
+        choice = input("Choose an option: ")
+        try:
+            if choice == '1':
+                sync_light_headers(node_address, headers)
+                print(f"Synced and verified {len(headers)} headers. Tip: {headers[-1]['hash']}")
+            elif choice == '2':
+                verify_light_payments(node_address, headers, wallet_address)
+            elif choice == '3':
+                txid = input("Transaction ID: ").strip()
+                sync_light_headers(node_address, headers)
+                print(verify_light_payment(node_address, headers, txid)[1])
+            elif choice == '4':
+                break
+            else:
+                print("Invalid choice, please try again.")
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print(f"Error: {e}")
+
+
 def main():
     node_address = get_node_address()
     node_wallet_address = get_node_wallet_address(node_address)
     if not node_wallet_address:
         print("Error: Unable to retrieve wallet address.")
         return
+    if "--light" in sys.argv:
+        light_mode(node_address, node_wallet_address)
+        return
     while True:
         print("1. Add transactions and mine a new block")
         print("2. View blockchain")
@@ -312,7 +488,8 @@ def main():
         print("5. Display your wallet details")
         print("6. View other nodes' wallets")
         print("7. Simulate a Transaction Pinning Attack")
-        print("8. Exit")
+        print("8. Look up a block or transaction")
+        print("9. Exit")
         choice = input("Choose an option: ")
         if choice == '1':
             mine_new_block(node_address, node_wallet_address)
@@ -329,6 +506,8 @@ def main():
         elif choice == '7':
             simulate_pinning_attack(node_address, node_wallet_address)
         elif choice == '8':
+            lookup_block_or_transaction(node_address)
+        elif choice == '9':
             break
         else:
             print("Invalid choice, please try again.")
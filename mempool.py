@@ -0,0 +1,161 @@
+import heapq
+import threading
+from merkle import serialize_transaction, transaction_hash
+from signatures import has_valid_fields
+from state import is_coinbase
+
+
+class Mempool:
+    def __init__(self, max_count=50000, max_bytes=32 * 1024 * 1024):
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evicted = 0
+        self._transactions = {}
+        self._sizes = {}
+        self._priority = []
+        self._eviction = []
+        self._spending = {}
+        self._lock = threading.RLock()
+        self.updated = threading.Event()
+
+    def __len__(self):
+        return len(self._transactions)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __contains__(self, txid):
+        if isinstance(txid, dict):
+            txid = transaction_hash(txid)
+        return txid in self._transactions
+
+    def get(self, txid):
+        return self._transactions.get(txid)
+
+    def to_list(self):
+        with self._lock:
+            return list(self._transactions.values())
+
+    def pending_spend(self, sender):
+        with self._lock:
+            return self._spending.get(sender, (0, 0))[0]
+
+    def txids(self):
+        with self._lock:
+            return list(self._transactions)
+
+    def add(self, transaction):
+        # Coinbase transactions are created by miners inside blocks and never relayed
+        if is_coinbase(transaction) or not has_valid_fields(transaction):
+            return None
+        txid = transaction_hash(transaction)
+        with self._lock:
+            if txid in self._transactions:
+                return None
+            size = len(serialize_transaction(transaction))
+            fee = transaction['fee']
+            timestamp = transaction['timestamp']
+            # Both heap keys are built before any state changes, so a rejected add leaves nothing behind
+            priority = (-fee, timestamp, txid)
+            eviction = (fee, -timestamp, txid)
+            self._transactions[txid] = transaction
+            self._sizes[txid] = size
+            self.total_bytes += size
+            self._track_spend(transaction, 1)
+            heapq.heappush(self._priority, priority)
+            heapq.heappush(self._eviction, eviction)
+            while len(self._transactions) > self.max_count or self.total_bytes > self.max_bytes:
+                evicted_txid = self._pop_valid(self._eviction)
+                self._discard(evicted_txid)
+                self.evicted += 1
+                if evicted_txid == txid:
+                    return None
+            self._compact()
+            self.updated.set()
+            return txid
+
+    def remove(self, transactions):
+        removed = 0
+        with self._lock:
+            for transaction in transactions:
+                txid = transaction if isinstance(transaction, str) else transaction_hash(transaction)
+                if txid in self._transactions:
+                    self._discard(txid)
+                    removed += 1
+            self._compact()
+        return removed
+
+    def replace(self, transactions):
+        with self._lock:
+            self.clear()
+            for transaction in transactions:
+                self.add(transaction)
+
+    def clear(self):
+        with self._lock:
+            self._transactions.clear()
+            self._sizes.clear()
+            self._priority.clear()
+            self._eviction.clear()
+            self._spending.clear()
+            self.total_bytes = 0
+
+    def select(self, max_count, max_bytes=None):
+        selected = []
+        popped = []
+        seen = set()
+        size = 0
+        with self._lock:
+            while self._priority and len(selected) < max_count:
+                entry = heapq.heappop(self._priority)
+                txid = entry[2]
+                if txid not in self._transactions or txid in seen:
+                    continue
+                seen.add(txid)
+                if max_bytes is not None and self._sizes[txid] > max_bytes:
+                    # Larger than any block, so it would sit at the front of every template
+                    self._discard(txid)
+                    self.evicted += 1
+                    continue
+                popped.append(entry)
+                if max_bytes is not None and size + self._sizes[txid] > max_bytes:
+                    continue
+                size += self._sizes[txid]
+                selected.append(self._transactions[txid])
+            for entry in popped:
+                heapq.heappush(self._priority, entry)
+        return selected
+
+    def _pop_valid(self, heap):
+        while True:
+            txid = heapq.heappop(heap)[2]
+            if txid in self._transactions:
+                return txid
+
+    def _track_spend(self, transaction, direction):
+        sender = transaction.get('sender')
+        amount = transaction.get('amount')
+        fee = transaction.get('fee') or 0
+        if not isinstance(sender, str) or not isinstance(amount, (int, float)) or not isinstance(fee, (int, float)):
+            return
+        amount += fee
+        total, count = self._spending.get(sender, (0, 0))
+        total, count = total + direction * amount, count + direction
+        if count:
+            self._spending[sender] = (total, count)
+        else:
+            self._spending.pop(sender, None)
+
+    def _discard(self, txid):
+        self._track_spend(self._transactions[txid], -1)
+        del self._transactions[txid]
+        self.total_bytes -= self._sizes.pop(txid)
+
+    def _compact(self):
+        if len(self._priority) > 2 * len(self._transactions) + 64:
+            self._priority = [entry for entry in self._priority if entry[2] in self._transactions]
+            heapq.heapify(self._priority)
+        if len(self._eviction) > 2 * len(self._transactions) + 64:
+            self._eviction = [entry for entry in self._eviction if entry[2] in self._transactions]
+            heapq.heapify(self._eviction)
@@ -0,0 +1,57 @@
+import hashlib
+import json
+
+EMPTY_MERKLE_ROOT = "0" * 64
+
+
+def serialize_transaction(transaction):
+    if isinstance(transaction, dict):
+        return json.dumps(transaction, sort_keys=True, separators=(",", ":")).encode()
+    return str(transaction).encode()
+
+
+def transaction_hash(transaction):
+    return hashlib.sha256(serialize_transaction(transaction)).hexdigest()
+
+
+def hash_pair(left, right):
+    return hashlib.sha256(bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+class MerkleTree:
+    def __init__(self, transactions):
+        if not isinstance(transactions, list):
+            transactions = [transactions]
+        self.levels = [[transaction_hash(txn) for txn in transactions]]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            if len(level) % 2:
+                level = level + [level[-1]]
+            self.levels.append([hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)])
+
+    @property
+    def root(self):
+        if not self.levels[0]:
+            return EMPTY_MERKLE_ROOT
+        return self.levels[-1][0]
+
+    def proof(self, position):
+        path = []
+        for level in self.levels[:-1]:
+            if position % 2:
+                path.append(["left", level[position - 1]])
+            else:
+                path.append(["right", level[min(position + 1, len(level) - 1)]])
+            position //= 2
+        return path
+
+
+def merkle_root(transactions):
+    return MerkleTree(transactions).root
+
+
+def verify_merkle_proof(txid, proof, root):
+    current = txid
+    for side, sibling in proof:
+        current = hash_pair(sibling, current) if side == "left" else hash_pair(current, sibling)
+    return current == root
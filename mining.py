@@ -0,0 +1,151 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+
+class MiningHasher:
+    def __init__(self, header):
+        self.header = header
+        self._state = hashlib.sha256(header.encode())
+
+    def hash_nonce(self, nonce):
+        state = self._state.copy()
+        state.update(str(nonce).encode())
+        return state.hexdigest()
+
+
+def _scan_chunk(hash_nonce, target, start, chunk_size):
+    for nonce in range(start, start + chunk_size):
+        block_hash = hash_nonce(nonce)
+        if block_hash <= target:
+            return nonce, block_hash
+    return None
+
+
+def _worker_loop(jobs, results, generation, hash_counter, offset, stride, chunk_size):
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job_generation, header, target = job
+        hash_nonce = MiningHasher(header).hash_nonce
+        chunk = offset
+        while generation.value == job_generation:
+            start = chunk * chunk_size
+            found = _scan_chunk(hash_nonce, target, start, chunk_size)
+            with hash_counter.get_lock():
+                hash_counter.value += found[0] - start + 1 if found else chunk_size
+            if found:
+                results.put((job_generation, found[0], found[1]))
+                break
+            chunk += stride
+
+
+class MiningWorker:
+    def __init__(self, workers=1, chunk_size=20000):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.last_hashes = 0
+        self.last_hash_rate = 0.0
+        self._generation = multiprocessing.Value('Q', 0)
+        self._hash_counter = multiprocessing.Value('Q', 0)
+        self._results = multiprocessing.Queue()
+        self._jobs = []
+        self._processes = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            jobs = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_worker_loop,
+                args=(jobs, self._results, self._generation, self._hash_counter, i, self.workers, self.chunk_size),
+                daemon=True
+            )
+            process.start()
+            self._jobs.append(jobs)
+            self._processes.append(process)
+
+    def stop(self):
+        self.cancel()
+        for jobs in self._jobs:
+            jobs.put(None)
+        for process in self._processes:
+            process.join()
+        self._jobs = []
+        self._processes = []
+
+    def _next_generation(self):
+        with self._generation.get_lock():
+            self._generation.value += 1
+            return self._generation.value
+
+    def submit(self, block, target):
+        with self._lock:
+            job_generation = self._next_generation()
+            with self._hash_counter.get_lock():
+                self._hash_counter.value = 0
+            job = (job_generation, block.header_prefix(), target)
+            for jobs in self._jobs:
+                jobs.put(job)
+        return job_generation
+
+    def cancel(self):
+        with self._lock:
+            self._next_generation()
+
+    def wait(self, job_generation, timeout=None):
+        deadline = time.time() + timeout if timeout is not None else None
+        while self._generation.value == job_generation:
+            if deadline is not None and time.time() >= deadline:
+                return None
+            try:
+                result_generation, nonce, block_hash = self._results.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if result_generation != job_generation:
+                continue
+            with self._lock:
+                if self._generation.value != job_generation:
+                    return None
+                self._next_generation()
+            return nonce, block_hash
+        return None
+
+    def mine(self, block, target, timeout=None):
+        start_time = time.time()
+        job_generation = self.submit(block, target)
+        solution = self.wait(job_generation, timeout)
+        time_taken = time.time() - start_time
+        self.last_hashes = self._hash_counter.value
+        self.last_hash_rate = self.last_hashes / time_taken if time_taken > 0 else 0.0
+        if solution is None:
+            print(f"Mining of block {block.index} abandoned after {time_taken:.2f} seconds")
+            return None
+        block.nonce, block.hash = solution
+        print(f"Proof of Work completed with {self.workers} workers. "
+              f"Time taken: {time_taken:.2f} seconds, Hashes: {self.last_hashes}, "
+              f"Hash rate: {self.last_hash_rate:.0f} H/s")
+        return block
+
+
+class ParallelMiner:
+    def __init__(self, workers=None, chunk_size=20000):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.last_hashes = 0
+        self.last_hash_rate = 0.0
+
+    def mine(self, block, target):
+        worker = MiningWorker(self.workers, self.chunk_size)
+        worker.start()
+        try:
+            worker.mine(block, target)
+        finally:
+            worker.stop()
+        self.last_hashes = worker.last_hashes
+        self.last_hash_rate = worker.last_hash_rate
+        return block.hash
@@ -0,0 +1,49 @@
+import concurrent.futures
+import requests
+from requests.adapters import HTTPAdapter
+
+NODE_ADDRESS_HEADER = "X-Node-Address"
+
+
+class PeerClient:
+    def __init__(self, max_workers=8, pool_size=16, timeout=(2, 5)):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="peer")
+
+    def advertise(self, node_address):
+        # Sent with every peer request so the receiving node can tell local peers apart
+        self.session.headers[NODE_ADDRESS_HEADER] = node_address
+
+    def request(self, method, url, timeout=None, **kwargs):
+        return self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def gather(self, nodes, call, deadline=None):
+        futures = {self.executor.submit(call, node): node for node in nodes}
+        done, not_done = concurrent.futures.wait(futures, timeout=deadline)
+        results = {}
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+        for future in not_done:
+            future.cancel()
+            results[futures[future]] = TimeoutError(f"no response within {deadline} seconds")
+        return results
+
+    def broadcast(self, nodes, method, path, deadline=None, timeout=None, **kwargs):
+        return self.gather(
+            nodes,
+            lambda node: self.request(method, f"{node}{path}", timeout=timeout, **kwargs),
+            deadline
+        )
@@ -0,0 +1,91 @@
+import time
+import threading
+from collections import deque
+
+
+class MiningScheduler:
+    def __init__(self, mempool, max_transactions=500, max_bytes=256 * 1024, min_transactions=1,
+                 batch_delay=0.5, idle_timeout=30.0, history=20):
+        self.mempool = mempool
+        self.max_transactions = max_transactions
+        self.max_bytes = max_bytes
+        self.min_transactions = min_transactions
+        self.batch_delay = batch_delay
+        self.idle_timeout = idle_timeout
+        self.wakeups = {"event": 0, "deadline": 0, "idle": 0}
+        self.templates = {"full": 0, "deadline": 0, "empty": 0}
+        self.transactions_mined = 0
+        self.recent = deque(maxlen=history)
+        self._stalled = False
+        self._lock = threading.Lock()
+
+    def pressure(self):
+        return max(
+            len(self.mempool) / self.max_transactions,
+            self.mempool.total_bytes / self.max_bytes
+        )
+
+    def _wait(self, timeout):
+        woke = self.mempool.updated.wait(timeout)
+        self.mempool.updated.clear()
+        return woke
+
+    def next_template(self):
+        waiting_since = None
+        while True:
+            if self._stalled:
+                # The last template came out empty, so retrying before the mempool changes would spin
+                self._stalled = False
+                self.wakeups["event" if self._wait(self.idle_timeout) else "idle"] += 1
+                continue
+            pending = len(self.mempool)
+            if pending < self.min_transactions:
+                waiting_since = None
+                self.wakeups["event" if self._wait(self.idle_timeout) else "idle"] += 1
+                continue
+            if waiting_since is None:
+                waiting_since = time.time()
+            if self.pressure() >= 1:
+                reason = "full"
+                break
+            remaining = waiting_since + self.batch_delay - time.time()
+            if remaining <= 0:
+                reason = "deadline"
+                break
+            self.wakeups["event" if self._wait(remaining) else "deadline"] += 1
+        return {
+            "reason": reason,
+            "pending": pending,
+            "pending_bytes": self.mempool.total_bytes,
+            "pressure": round(self.pressure(), 3),
+            "waited_ms": round((time.time() - waiting_since) * 1000, 1),
+            "max_transactions": self.max_transactions,
+            "max_bytes": self.max_bytes
+        }
+
+    def record(self, decision, mined):
+        # mined is None when no pending transaction could go into the template
+        with self._lock:
+            if mined is None:
+                self._stalled = True
+                decision = dict(decision, reason="empty")
+                mined = 0
+            decision = dict(decision, mined=mined, at=time.time())
+            self.templates[decision["reason"]] += 1
+            self.transactions_mined += mined
+            self.recent.append(decision)
+
+    def stats(self):
+        with self._lock:
+            templates = sum(self.templates.values())
+            return {
+                "max_transactions": self.max_transactions,
+                "max_bytes": self.max_bytes,
+                "batch_delay_seconds": self.batch_delay,
+                "pressure": round(self.pressure(), 3),
+                "wakeups": dict(self.wakeups),
+                "templates": dict(self.templates),
+                "transactions_mined": self.transactions_mined,
+                "average_template_size": round(self.transactions_mined / templates, 2) if templates else 0.0,
+                "recent_decisions": list(self.recent)
+            }
@@ -0,0 +1,98 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class BloomFilter:
+    def __init__(self, size_bits, hashes=4):
+        self.size_bits = size_bits
+        self.hashes = hashes
+        self.count = 0
+        self._bits = bytearray(-(-size_bits // 8))
+
+    def _positions(self, key):
+        digest = hashlib.sha256(key.encode()).digest()
+        return [int.from_bytes(digest[i * 4:i * 4 + 4], "little") % self.size_bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SeenCache:
+    def __init__(self, max_entries=100000, ttl=600.0, bloom_bits=0, bloom_hashes=4):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bloom_bits = bloom_bits
+        self.bloom_hashes = bloom_hashes
+        self.hits = 0
+        self.lookups = 0
+        self._lock = threading.Lock()
+        if bloom_bits:
+            # Two generations rotated every half TTL: a key survives between ttl / 2 and ttl
+            self._current = BloomFilter(bloom_bits, bloom_hashes)
+            self._previous = BloomFilter(bloom_bits, bloom_hashes)
+            self._rotated = time.monotonic()
+        else:
+            self._entries = OrderedDict()
+
+    def _expire(self, now):
+        if self.bloom_bits:
+            if now - self._rotated >= self.ttl / 2 or self._current.count >= self.max_entries // 2:
+                self._previous = self._current
+                self._current = BloomFilter(self.bloom_bits, self.bloom_hashes)
+                self._rotated = now
+            return
+        # Every entry has the same TTL, so insertion order is also expiry order
+        while self._entries and next(iter(self._entries.values())) <= now:
+            self._entries.popitem(last=False)
+
+    def _contains(self, key):
+        if self.bloom_bits:
+            return key in self._current or key in self._previous
+        return key in self._entries
+
+    def _add(self, key, now):
+        if self.bloom_bits:
+            self._current.add(key)
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = now + self.ttl
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            self._expire(time.monotonic())
+            self.lookups += 1
+            if self._contains(key):
+                self.hits += 1
+                return True
+            return False
+
+    def add(self, key):
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._add(key, now)
+
+    def stats(self):
+        with self._lock:
+            if self.bloom_bits:
+                entries = self._current.count + self._previous.count
+            else:
+                entries = len(self._entries)
+            return {
+                "mode": "bloom" if self.bloom_bits else "exact",
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "bloom_bits": self.bloom_bits,
+                "lookups": self.lookups,
+                "hits": self.hits
+            }
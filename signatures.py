@@ -0,0 +1,139 @@
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+import rsa
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+TRANSACTION_FIELDS = ("sender", "receiver", "amount", "fee", "timestamp", "signature")
+SIGNED_FIELDS = ("sender", "receiver", "amount", "fee", "timestamp")
+
+public_key_cache = LRUCache(4096)
+signature_cache = LRUCache(100000)
+
+
+def load_public_key(address):
+    public_key = public_key_cache.get(address)
+    if public_key is None:
+        public_key = rsa.PublicKey.load_pkcs1(address)
+        public_key_cache.put(address, public_key)
+    return public_key
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def check_signed_fields(sender, receiver, amount, fee, timestamp):
+    if not isinstance(sender, str) or not isinstance(receiver, str):
+        raise TypeError("Sender and receiver must be strings")
+    if not all(is_number(value) for value in (amount, fee, timestamp)):
+        raise ValueError("Amount, fee and timestamp must be finite numbers")
+
+
+def has_valid_fields(transaction):
+    try:
+        check_signed_fields(*(transaction.get(field) for field in SIGNED_FIELDS))
+    except (AttributeError, TypeError, ValueError):
+        return False
+    return True
+
+
+def transaction_message(sender, receiver, amount, fee, timestamp):
+    # Canonical JSON keeps field boundaries, so digits cannot move between fields under one signature
+    check_signed_fields(sender, receiver, amount, fee, timestamp)
+    payload = {"sender": sender, "receiver": receiver, "amount": amount, "fee": fee, "timestamp": timestamp}
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+
+
+def signature_cache_key(sender, message, signature):
+    return hashlib.sha256(b"\0".join([sender.encode(), message, signature])).digest()
+
+
+def verify_signature(sender, message, signature):
+    cache_key = signature_cache_key(sender, message, signature)
+    if signature_cache.get(cache_key):
+        return True
+    public_key = load_public_key(sender)
+    # PKCS#1 v1.5 signatures are deterministic, so a full-length signature is the only encoding of one
+    if len(signature) != rsa.common.byte_size(public_key.n):
+        raise rsa.VerificationError("Signature length does not match the key size")
+    rsa.verify(message, signature, public_key)
+    signature_cache.put(cache_key, True)
+    return True
+
+
+def transaction_signature_parts(transaction):
+    message = transaction_message(*(transaction[field] for field in SIGNED_FIELDS))
+    signature = transaction["signature"]
+    # Only lowercase hex is accepted, so the transaction ID is fixed by the signed payload
+    if not isinstance(signature, str) or bytes.fromhex(signature).hex() != signature:
+        raise ValueError("Signature must be lowercase hex")
+    return transaction["sender"], message, bytes.fromhex(signature)
+
+
+def has_unsigned_fields(transaction):
+    # The transaction ID hashes every field, so an unsigned extra field would mint a new ID for a signed payment
+    return not set(transaction) <= set(TRANSACTION_FIELDS)
+
+
+def verify_transaction_signature(transaction):
+    try:
+        return verify_signature(*transaction_signature_parts(transaction))
+    except Exception:
+        return False
+
+
+def is_signature_cached(transaction):
+    try:
+        return bool(signature_cache.get(signature_cache_key(*transaction_signature_parts(transaction))))
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def mark_signature_verified(transaction):
+    signature_cache.put(signature_cache_key(*transaction_signature_parts(transaction)), True)
+
+
+def cache_stats():
+    return {
+        "public_keys": public_key_cache.stats(),
+        "signatures": signature_cache.stats()
+    }
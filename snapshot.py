@@ -0,0 +1,94 @@
+import json
+import os
+import time
+import rsa
+
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotManager:
+    def __init__(self, directory, interval_blocks=20, interval_seconds=60):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "snapshot.json")
+        self.interval_blocks = interval_blocks
+        self.interval_seconds = interval_seconds
+        self.last_height = None
+        self.last_saved = 0.0
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as file:
+                snapshot = json.load(file)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            print(f"Ignoring unreadable snapshot {self.path}: {e}")
+            return None
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            print(f"Ignoring snapshot {self.path} with unsupported version {snapshot.get('version')}")
+            return None
+        self.last_height = snapshot["height"]
+        self.last_saved = snapshot["created_at"]
+        return snapshot
+
+    def wallet_keys(self, snapshot):
+        if not snapshot or "wallet" not in snapshot:
+            return None
+        return (
+            rsa.PublicKey.load_pkcs1(snapshot["wallet"]["public_key"].encode()),
+            rsa.PrivateKey.load_pkcs1(snapshot["wallet"]["private_key"].encode())
+        )
+
+    def save(self, blockchain, wallet):
+        with blockchain.lock:
+            snapshot = {
+                "version": SNAPSHOT_VERSION,
+                "created_at": time.time(),
+                "height": blockchain.state.height,
+                "tip_hash": blockchain.state.tip_hash,
+                "balances": dict(blockchain.state.balances),
+                "mempool": blockchain.mempool.to_list(),
+                "wallet": self._wallet(wallet)
+            }
+        return self._write(snapshot)
+
+    def save_wallet(self, wallet):
+        # Written before the node holds a chain, so its address can be allocated in the genesis block
+        return self._write({
+            "version": SNAPSHOT_VERSION,
+            "created_at": 0.0,
+            "height": -1,
+            "tip_hash": None,
+            "balances": {},
+            "mempool": [],
+            "wallet": self._wallet(wallet)
+        })
+
+    @staticmethod
+    def _wallet(wallet):
+        return {
+            "public_key": wallet.public_key.save_pkcs1().decode(),
+            "private_key": wallet.private_key.save_pkcs1().decode()
+        }
+
+    def _write(self, snapshot):
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w') as file:
+            json.dump(snapshot, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.path)
+        self.last_height = snapshot["height"]
+        self.last_saved = snapshot["created_at"]
+        print(f"State snapshot saved at height {snapshot['height']}")
+        return snapshot
+
+    def maybe_save(self, blockchain, wallet):
+        height = blockchain.state.height
+        if self.last_height is not None and height == self.last_height and not len(blockchain.mempool):
+            return None
+        blocks_due = self.last_height is None or height - self.last_height >= self.interval_blocks
+        time_due = time.time() - self.last_saved >= self.interval_seconds
+        if blocks_due or time_due:
+            return self.save(blockchain, wallet)
+        return None
@@ -0,0 +1,122 @@
+import threading
+
+COINBASE_SENDERS = ("System", "SYSTEM")
+
+
+def is_coinbase(transaction):
+    return transaction.get("sender") in COINBASE_SENDERS
+
+
+def block_transactions(block):
+    return block.transactions if isinstance(block.transactions, list) else []
+
+
+class LedgerState:
+    def __init__(self, max_undo_depth=1000):
+        self.max_undo_depth = max_undo_depth
+        self.balances = {}
+        self.height = -1
+        self.tip_hash = None
+        self._journal = []
+        self._lock = threading.RLock()
+
+    def get_balance(self, address):
+        return self.balances.get(address, 0)
+
+    def _apply_to(self, overlay, txn):
+        # Raises before touching the overlay, so a rejected transaction leaves it unchanged
+        if txn["amount"] < 0 or txn["fee"] < 0:
+            raise ValueError(f"Negative amount or fee in transaction from {txn['sender']}")
+        if not is_coinbase(txn):
+            balance = overlay.get(txn["sender"], self.get_balance(txn["sender"])) - txn["amount"] - txn["fee"]
+            if balance < 0:
+                raise ValueError(f"Insufficient balance for {txn['sender']}")
+            overlay[txn["sender"]] = balance
+        overlay[txn["receiver"]] = overlay.get(txn["receiver"], self.get_balance(txn["receiver"])) + txn["amount"]
+
+    def check_coinbase(self, block):
+        transactions = block_transactions(block)
+        coinbase = [txn for txn in transactions if is_coinbase(txn)]
+        # Only the genesis allocation creates money; later blocks may only pay out their fees
+        if block.index == 0 or not coinbase:
+            return
+        if len(coinbase) > 1:
+            raise ValueError("Block has more than one coinbase transaction")
+        fees = sum(txn["fee"] for txn in transactions if not is_coinbase(txn))
+        if coinbase[0]["amount"] > fees:
+            raise ValueError(f"Coinbase pays {coinbase[0]['amount']} but the block only collects {fees} in fees")
+
+    def check_block(self, block):
+        self.check_coinbase(block)
+        overlay = {}
+        for txn in block_transactions(block):
+            self._apply_to(overlay, txn)
+
+    def spendable(self, transactions):
+        overlay = {}
+        selected = []
+        for txn in transactions:
+            if is_coinbase(txn):
+                continue
+            try:
+                self._apply_to(overlay, txn)
+            except (KeyError, TypeError, ValueError):
+                continue
+            selected.append(txn)
+        return selected
+
+    def apply_block(self, block):
+        undo = {}
+        with self._lock:
+            for txn in block_transactions(block):
+                touched = [txn["receiver"]] if is_coinbase(txn) else [txn["sender"], txn["receiver"]]
+                for address in touched:
+                    undo.setdefault(address, self.balances.get(address))
+                if not is_coinbase(txn):
+                    self.balances[txn["sender"]] = self.get_balance(txn["sender"]) - txn["amount"] - txn.get("fee", 0)
+                self.balances[txn["receiver"]] = self.get_balance(txn["receiver"]) + txn["amount"]
+            self._journal.append((self.tip_hash, undo))
+            if len(self._journal) > self.max_undo_depth:
+                self._journal.pop(0)
+            self.height = block.index
+            self.tip_hash = block.hash
+        return undo
+
+    def undo_block(self):
+        with self._lock:
+            previous_tip, undo = self._journal.pop()
+            for address, balance in undo.items():
+                if balance is None:
+                    self.balances.pop(address, None)
+                else:
+                    self.balances[address] = balance
+            self.height -= 1
+            self.tip_hash = previous_tip
+
+    def rollback_to(self, height):
+        with self._lock:
+            if self.height - height > len(self._journal):
+                return False
+            while self.height > height:
+                self.undo_block()
+            return True
+
+    def restore(self, balances, height, tip_hash):
+        with self._lock:
+            self.balances = dict(balances)
+            self.height = height
+            self.tip_hash = tip_hash
+            self._journal = []
+
+    def reset(self):
+        with self._lock:
+            self.balances = {}
+            self.height = -1
+            self.tip_hash = None
+            self._journal = []
+
+    def rebuild(self, blocks):
+        with self._lock:
+            self.reset()
+            for block in blocks:
+                self.apply_block(block)
@@ -0,0 +1,172 @@
+import json
+import mmap
+import os
+import struct
+import threading
+
+INDEX_ENTRY = struct.Struct("<Q32s")
+
+
+class ChainStore:
+    def __init__(self, directory, decode, fsync=False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.decode = decode
+        self.fsync = fsync
+        self.log_path = os.path.join(directory, "blocks.log")
+        self.index_path = os.path.join(directory, "blocks.idx")
+        self._log = open(self.log_path, "a+b")
+        self._index = open(self.index_path, "a+b")
+        self._log_map = None
+        self._index_map = None
+        self._length = 0
+        self._log_size = 0
+        self._tip = None
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        index_size = os.path.getsize(self.index_path)
+        self._length = index_size // INDEX_ENTRY.size
+        if index_size % INDEX_ENTRY.size:
+            self._index.truncate(self._length * INDEX_ENTRY.size)
+        self._log_size = os.path.getsize(self.log_path)
+        for height in range(self._length):
+            offset = self._entry(height)[0]
+            if offset >= self._log_size:
+                self._length = height
+                self._close_maps()
+                self._index.truncate(height * INDEX_ENTRY.size)
+                break
+        self._recover_tail()
+        print(f"Chain store loaded from {self.directory}. Blocks: {self._length}")
+
+    def _recover_tail(self):
+        end = 0
+        if self._length:
+            self._log.seek(self._entry(self._length - 1)[0])
+            last_record = self._log.readline()
+            end = self._log.tell() if last_record.endswith(b"\n") else self._log_size
+        self._log.seek(end)
+        recovered = 0
+        for line in self._log:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                block_hash = json.loads(line)["hash"]
+            except (ValueError, KeyError):
+                break
+            self._write_index(end, block_hash)
+            end += len(line)
+            recovered += 1
+        if end < self._log_size:
+            self._close_maps()
+            self._log.truncate(end)
+        self._log_size = end
+        if recovered:
+            print(f"Recovered {recovered} unindexed blocks from {self.log_path}")
+
+    def _close_maps(self):
+        if self._log_map is not None:
+            self._log_map.close()
+            self._log_map = None
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_map = None
+
+    def _map(self, current, handle, size):
+        if current is not None and len(current) >= size:
+            return current
+        if current is not None:
+            current.close()
+        handle.flush()
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _entry(self, height):
+        end = (height + 1) * INDEX_ENTRY.size
+        self._index_map = self._map(self._index_map, self._index, end)
+        return INDEX_ENTRY.unpack_from(self._index_map, height * INDEX_ENTRY.size)
+
+    def _record_end(self, height):
+        if height + 1 < self._length:
+            return self._entry(height + 1)[0]
+        return self._log_size
+
+    def _write_index(self, offset, block_hash):
+        raw_hash = bytes.fromhex(block_hash)
+        self._index.seek(0, os.SEEK_END)
+        self._index.write(INDEX_ENTRY.pack(offset, raw_hash))
+        self._index.flush()
+        self._length += 1
+
+    def _read(self, height):
+        start = self._entry(height)[0]
+        end = self._record_end(height)
+        self._log_map = self._map(self._log_map, self._log, end)
+        return self.decode(json.loads(self._log_map[start:end]))
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for height in range(self._length):
+            yield self[height]
+
+    def __getitem__(self, key):
+        with self._lock:
+            if isinstance(key, slice):
+                return [self[height] for height in range(*key.indices(self._length))]
+            height = key + self._length if key < 0 else key
+            if height < 0 or height >= self._length:
+                raise IndexError("chain index out of range")
+            if height == self._length - 1:
+                if self._tip is None:
+                    self._tip = self._read(height)
+                return self._tip
+            return self._read(height)
+
+    def __delitem__(self, key):
+        if not isinstance(key, slice) or key.stop is not None or key.step is not None:
+            raise TypeError("only trailing slices can be deleted from the chain store")
+        self.truncate(key.indices(self._length)[0])
+
+    def hash_at(self, height):
+        with self._lock:
+            if height < 0 or height >= self._length:
+                raise IndexError("chain index out of range")
+            return self._entry(height)[1].hex()
+
+    def append(self, block):
+        record = json.dumps(vars(block)).encode() + b"\n"
+        with self._lock:
+            self._log.seek(0, os.SEEK_END)
+            offset = self._log.tell()
+            self._log.write(record)
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            self._log_size = offset + len(record)
+            self._write_index(offset, block.hash)
+            self._tip = block
+
+    def extend(self, blocks):
+        for block in blocks:
+            self.append(block)
+
+    def truncate(self, height):
+        with self._lock:
+            if height >= self._length:
+                return
+            offset = self._entry(height)[0] if height else 0
+            self._close_maps()
+            self._log.truncate(offset)
+            self._index.truncate(height * INDEX_ENTRY.size)
+            self._length = height
+            self._log_size = offset
+            self._tip = None
+
+    def close(self):
+        with self._lock:
+            self._close_maps()
+            self._log.close()
+            self._index.close()
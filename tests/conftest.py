@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blockchain import Block, BlockChain, Wallet  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def wallet():
+    return Wallet()
+
+
+@pytest.fixture
+def chain(wallet):
+    return BlockChain(difficulty=1, retarget_interval=100000, allocations={wallet.get_address(): 1000})
+
+
+def build_block(chain, transactions):
+    block = Block(len(chain.chain), transactions, chain.get_latest_block().hash, target=chain.next_target())
+    block.mine_block(block.target)
+    return block
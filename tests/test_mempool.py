@@ -0,0 +1,52 @@
+import pytest
+
+from mempool import Mempool
+
+
+def payment(fee, timestamp=1.0, sender="alice", amount=1):
+    return {"sender": sender, "receiver": "bob", "amount": amount, "fee": fee, "timestamp": timestamp, "signature": "00"}
+
+
+@pytest.mark.parametrize("field, value", [
+    ("timestamp", "later"), ("fee", "1"), ("fee", None), ("amount", float("nan")), ("sender", 7),
+])
+def test_bad_types_leave_no_trace(field, value):
+    mempool = Mempool()
+    mempool.add(payment(1))
+    assert mempool.add(dict(payment(2), **{field: value})) is None
+    assert len(mempool) == 1
+    assert mempool.pending_spend("alice") == 2
+    assert mempool.select(10) == [payment(1)]
+
+
+def test_coinbase_is_never_admitted():
+    assert Mempool().add(dict(payment(0), sender="System")) is None
+
+
+def test_select_orders_by_fee_then_age():
+    mempool = Mempool()
+    for fee, timestamp in [(1, 1.0), (3, 2.0), (1, 0.5)]:
+        mempool.add(payment(fee, timestamp))
+    assert [(t["fee"], t["timestamp"]) for t in mempool.select(10)] == [(3, 2.0), (1, 0.5), (1, 1.0)]
+
+
+def test_select_skips_what_does_not_fit_and_evicts_oversized():
+    mempool = Mempool()
+    huge = dict(payment(9), signature="ab" * 1000)
+    mempool.add(huge)
+    mempool.add(payment(5))
+    mempool.add(payment(1, timestamp=2.0))
+    selected = mempool.select(10, max_bytes=300)
+    assert [t["fee"] for t in selected] == [5, 1]
+    assert huge not in mempool
+    assert mempool.evicted == 1
+
+
+def test_full_mempool_evicts_lowest_fee():
+    mempool = Mempool(max_count=2)
+    mempool.add(payment(2))
+    mempool.add(payment(5, timestamp=2.0))
+    assert mempool.add(payment(1, timestamp=3.0)) is None
+    assert mempool.add(payment(9, timestamp=4.0)) is not None
+    assert sorted(t["fee"] for t in mempool) == [5, 9]
+    assert mempool.pending_spend("alice") == 1 + 5 + 1 + 9
@@ -0,0 +1,47 @@
+import pytest
+
+from blockchain import Transaction, Wallet
+from conftest import build_block
+from signatures import verify_transaction_signature
+
+
+@pytest.fixture
+def payment(wallet):
+    return Transaction(wallet, wallet.get_address(), Wallet().get_address(), 100, fee=1.0).to_dict()
+
+
+def test_digits_cannot_move_between_signed_fields(payment):
+    # Without delimiters fee=1.0, timestamp=17... and fee=1.01, timestamp=7... signed the same bytes
+    timestamp = str(payment["timestamp"])
+    moved = dict(payment, fee=float(f"1.0{timestamp[0]}"), timestamp=float(timestamp[1:]))
+    assert verify_transaction_signature(payment)
+    assert not verify_transaction_signature(moved)
+
+
+@pytest.mark.parametrize("signature", [str.upper, lambda signature: "00" + signature])
+def test_signature_has_one_encoding(payment, signature):
+    assert not verify_transaction_signature(dict(payment, signature=signature(payment["signature"])))
+
+
+@pytest.mark.parametrize("field, value", [
+    ("amount", float("nan")), ("amount", float("inf")), ("amount", "100"), ("amount", True),
+    ("fee", None), ("timestamp", "later"), ("receiver", 5),
+])
+def test_signed_fields_must_be_typed(payment, field, value):
+    assert not verify_transaction_signature(dict(payment, **{field: value}))
+
+
+def test_replayed_payment_is_rejected(chain, payment):
+    chain.add_block(build_block(chain, [payment]), check_balances=True)
+    with pytest.raises(ValueError, match="already in the chain"):
+        chain.check_block(build_block(chain, [payment]))
+
+
+def test_payment_twice_in_one_block_is_rejected(chain, payment):
+    with pytest.raises(ValueError, match="appears twice"):
+        chain.check_block(build_block(chain, [payment, dict(payment)]))
+
+
+def test_unsigned_fields_are_rejected(chain, payment):
+    with pytest.raises(ValueError, match="unsigned fields"):
+        chain.check_block(build_block(chain, [dict(payment, memo="again")]))
@@ -0,0 +1,33 @@
+import pytest
+
+from blockchain import Block
+from conftest import build_block
+from difficulty import MAX_TARGET, format_target
+from validation import BlockValidationError, BlockValidator
+
+
+def rejection(chain, block):
+    with pytest.raises(BlockValidationError) as error:
+        BlockValidator(chain).process(block, vars(block))
+    return error.value
+
+
+def test_wrong_target_on_the_tip_is_final(chain):
+    block = Block(len(chain.chain), [], chain.get_latest_block().hash, target=format_target(MAX_TARGET))
+    block.mine_block(block.target)
+    error = rejection(chain, block)
+    assert (error.stage, error.intrinsic) == ("header", True)
+
+
+def test_block_off_the_tip_may_be_accepted_later(chain):
+    parent = build_block(chain, [])
+    orphan = Block(parent.index + 1, [], parent.hash, target=chain.next_target())
+    orphan.mine_block(orphan.target)
+    error = rejection(chain, orphan)
+    assert (error.stage, error.intrinsic) == ("header", False)
+
+
+def test_tampered_hash_is_final(chain):
+    block = build_block(chain, [])
+    block.nonce += 1
+    assert rejection(chain, block).intrinsic
@@ -0,0 +1,49 @@
+import copy
+
+import pytest
+
+from blockchain import Transaction, Wallet
+from conftest import build_block
+from merkle import merkle_root
+
+
+@pytest.fixture
+def blocks(chain, wallet):
+    for _ in range(6):
+        payment = Transaction(wallet, wallet.get_address(), Wallet().get_address(), 1).to_dict()
+        chain.add_block(build_block(chain, [payment]))
+    return [copy.copy(block) for block in chain.chain]
+
+
+def tamper(block):
+    block.transactions = [dict(block.transactions[0], amount=500)]
+    block.merkle_root = merkle_root(block.transactions)
+
+
+@pytest.mark.parametrize("window", [{}, {"batch_size": 2, "workers": 2, "parallel_threshold": 1}])
+def test_link_failure_does_not_skip_earlier_checks(chain, blocks, window):
+    verifier = chain.verifier
+    for name, value in window.items():
+        setattr(verifier, name, value)
+    original = blocks[4]
+    tamper(blocks[2])
+    blocks[4] = copy.copy(original)
+    blocks[4].previous_hash = "0" * 64
+
+    report = verifier.verify_chain(blocks, full=True)
+    assert (report["valid"], report["index"]) == (False, 2)
+    assert verifier.watermark == 1
+
+    blocks[4] = original
+    report = verifier.verify_chain(blocks)
+    assert (report["valid"], report["index"]) == (False, 2)
+
+
+def test_watermark_keeps_the_verified_prefix_of_a_window(chain, blocks):
+    verifier = chain.verifier
+    assert verifier.verify_chain(blocks)["valid"]
+    tamper(blocks[5])
+    report = verifier.verify_chain(blocks, full=True)
+    assert (report["valid"], report["index"]) == (False, 5)
+    assert (verifier.watermark, verifier.watermark_hash) == (4, blocks[4].hash)
+    assert verifier.verify_chain(blocks)["checked_from"] == 5
@@ -0,0 +1,62 @@
+import random
+import zlib
+
+import pytest
+
+from blockchain import Transaction, Wallet
+from wire import HEADER, MAGIC, MAX_BODY, VERSION, WireFormatError, decode_blocks, encode_blocks
+
+
+@pytest.fixture(scope="module")
+def block():
+    wallet = Wallet()
+    transactions = [Transaction(wallet, wallet.get_address(), Wallet().get_address(), 1).to_dict() for _ in range(3)]
+    transactions.append({"sender": "System", "receiver": wallet.get_address(), "amount": 3, "fee": 0,
+                         "signature": None, "timestamp": 1, "memo": ["é", {"nested": True}]})
+    return {"index": 1, "timestamp": 1.5, "merkle_root": "ab" * 32, "previous_hash": "cd" * 32,
+            "target": "0f" * 32, "nonce": 7, "hash": "ef" * 32, "transactions": transactions}
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_round_trip(block, compress):
+    assert decode_blocks(encode_blocks([block], length=5, compress=compress)) == ([block], 5)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_mutated_payloads_only_raise_wire_format_errors(block, compress):
+    payload = encode_blocks([block, dict(block, transactions="Genesis Block")], compress=compress)
+    rng = random.Random(14)
+    for _ in range(3000):
+        data = bytearray(payload)
+        for _ in range(rng.randint(1, 4)):
+            position = rng.randrange(len(data))
+            operation = rng.random()
+            if operation < 0.6:
+                data[position] = rng.randrange(256)
+            elif operation < 0.8:
+                del data[position:position + rng.randint(1, 8)]
+            else:
+                data[position:position] = rng.randbytes(rng.randint(1, 8))
+        try:
+            decode_blocks(bytes(data))
+        except WireFormatError:
+            pass
+
+
+def compressed(body):
+    return HEADER.pack(MAGIC, VERSION, 1) + body
+
+
+def test_decompression_is_bounded():
+    bomb = zlib.compressobj()
+    body = b"".join(bomb.compress(bytes(1 << 20)) for _ in range(MAX_BODY // (1 << 20) + 1)) + bomb.flush()
+    with pytest.raises(WireFormatError, match="exceeds"):
+        decode_blocks(compressed(body))
+
+
+def test_trailing_compressed_data_is_rejected(block):
+    payload = encode_blocks([block], compress=True)
+    with pytest.raises(WireFormatError):
+        decode_blocks(payload + b"extra")
+    with pytest.raises(WireFormatError):
+        decode_blocks(payload[:-4])
@@ -0,0 +1,128 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from difficulty import meets_target
+from state import is_coinbase
+from signatures import is_signature_cached, mark_signature_verified, verify_transaction_signature
+
+VALIDATION_STAGES = ("header", "signatures", "state")
+
+
+class BlockValidationError(Exception):
+    def __init__(self, stage, message, intrinsic=False):
+        super().__init__(message)
+        self.stage = stage
+        # Intrinsic failures depend only on the block itself, so no chain state can make it valid later
+        self.intrinsic = intrinsic
+
+
+def _verify_batch(transactions):
+    return [verify_transaction_signature(txn) for txn in transactions]
+
+
+class BlockValidator:
+    def __init__(self, blockchain, workers=None, parallel_threshold=16):
+        self.blockchain = blockchain
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel_threshold = parallel_threshold
+        self.blocks_accepted = 0
+        self.blocks_rejected = {stage: 0 for stage in VALIDATION_STAGES}
+        self.transactions_validated = 0
+        self.stage_seconds = {stage: 0.0 for stage in VALIDATION_STAGES}
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def check_header(self, block, block_data):
+        if not isinstance(block.transactions, list) or not all(isinstance(txn, dict) for txn in block.transactions):
+            raise BlockValidationError("header", "Block transactions must be a list of transaction objects", True)
+        if block_data.get('merkle_root') != block.merkle_root:
+            raise BlockValidationError("header", "Merkle root does not match the block transactions", True)
+        if block.hash != block.calculate_hash():
+            raise BlockValidationError("header", "Block hash does not match its header", True)
+        target = self.blockchain.retarget.effective_target(block)
+        if not isinstance(target, str) or not meets_target(block.hash, target):
+            raise BlockValidationError("header", "Block hash does not satisfy its own proof-of-work target", True)
+        with self.blockchain.lock:
+            self.check_parent(block)
+            error = self.blockchain.retarget.check(block, block.index, self.blockchain.chain.__getitem__)
+        if error:
+            # The block extends this node's tip, so its expected target is fully known and a mismatch is final
+            raise BlockValidationError("header", error, True)
+
+    def check_parent(self, block):
+        last_block = self.blockchain.get_latest_block()
+        if block.previous_hash != last_block.hash or block.index != last_block.index + 1:
+            raise BlockValidationError("header", "Block does not extend the current chain tip")
+
+    def check_signatures(self, transactions):
+        results = [True] * len(transactions)
+        pending = [
+            position for position, txn in enumerate(transactions)
+            if not is_coinbase(txn) and not is_signature_cached(txn)
+        ]
+        batch = [transactions[position] for position in pending]
+        if len(batch) < self.parallel_threshold:
+            verified = _verify_batch(batch)
+        else:
+            chunk_size = -(-len(batch) // self.workers)
+            chunks = [batch[i:i + chunk_size] for i in range(0, len(batch), chunk_size)]
+            verified = [valid for chunk in self._pool().map(_verify_batch, chunks) for valid in chunk]
+        for position, valid in zip(pending, verified):
+            results[position] = valid
+            if valid:
+                mark_signature_verified(transactions[position])
+        return results
+
+    def verify_signatures(self, transactions):
+        for txn, valid in zip(transactions, self.check_signatures(transactions)):
+            if not valid:
+                raise BlockValidationError(
+                    "signatures", f"Invalid signature on transaction from {txn.get('sender')}", True
+                )
+
+    def apply_state(self, block):
+        with self.blockchain.lock:
+            self.check_parent(block)
+            try:
+                return self.blockchain.add_block(block, check_balances=True)
+            except (KeyError, TypeError, ValueError) as e:
+                raise BlockValidationError("state", str(e))
+
+    def process(self, block, block_data):
+        timings = {}
+        stages = (
+            ("header", lambda: self.check_header(block, block_data)),
+            ("signatures", lambda: self.verify_signatures(block.transactions)),
+            ("state", lambda: self.apply_state(block)),
+        )
+        result = None
+        for stage, run in stages:
+            start_time = time.perf_counter()
+            try:
+                result = run()
+            except BlockValidationError:
+                self.blocks_rejected[stage] += 1
+                raise
+            finally:
+                timings[stage] = time.perf_counter() - start_time
+                self.stage_seconds[stage] += timings[stage]
+        self.blocks_accepted += 1
+        self.transactions_validated += len(block.transactions)
+        print(f"Block {block.index} validated. " + ", ".join(
+            f"{stage}: {seconds * 1000:.1f} ms" for stage, seconds in timings.items()
+        ))
+        return result, {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+    def stats(self):
+        total_seconds = sum(self.stage_seconds.values())
+        return {
+            "blocks_accepted": self.blocks_accepted,
+            "blocks_rejected": self.blocks_rejected,
+            "transactions_validated": self.transactions_validated,
+            "stage_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stage_seconds.items()},
+            "transactions_per_second": round(self.transactions_validated / total_seconds, 2) if total_seconds else 0.0
+        }
@@ -0,0 +1,165 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from header import header_hash
+from difficulty import meets_target
+from merkle import merkle_root
+from signatures import verify_transaction_signature
+from state import is_coinbase
+
+
+def _check_record(record, default_target, check_signatures):
+    if header_hash(record) != record['hash']:
+        return "Block hash does not match its header"
+    if not meets_target(record['hash'], record.get('target') or default_target):
+        return "Block hash does not satisfy proof-of-work"
+    if merkle_root(record['transactions']) != record['merkle_root']:
+        return "Merkle root does not match the block transactions"
+    if check_signatures and isinstance(record['transactions'], list):
+        for txn in record['transactions']:
+            if isinstance(txn, dict) and not is_coinbase(txn) and not verify_transaction_signature(txn):
+                return f"Invalid signature on transaction from {txn.get('sender')}"
+    return None
+
+
+def _verify_batch(records, default_target, check_signatures):
+    for record in records:
+        error = _check_record(record, default_target, check_signatures)
+        if error:
+            return record['index'], error
+    return None
+
+
+class ChainVerifier:
+    def __init__(self, retarget, state_path=None, workers=None, batch_size=64, parallel_threshold=32):
+        self.retarget = retarget
+        self.state_path = state_path
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.parallel_threshold = parallel_threshold
+        self.watermark = -1
+        self.watermark_hash = None
+        self._executor = None
+        self._load()
+
+    def _load(self):
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, 'r') as file:
+                state = json.load(file)
+            self.watermark = state["height"]
+            self.watermark_hash = state["hash"]
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, KeyError) as e:
+            print(f"Ignoring unreadable verification state {self.state_path}: {e}")
+
+    def _save(self):
+        if not self.state_path:
+            return
+        temporary_path = f"{self.state_path}.tmp"
+        with open(temporary_path, 'w') as file:
+            json.dump({"height": self.watermark, "hash": self.watermark_hash}, file)
+        os.replace(temporary_path, self.state_path)
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _check_records(self, records, check_signatures):
+        check = partial(_verify_batch, default_target=self.retarget.initial_target, check_signatures=check_signatures)
+        if len(records) < self.parallel_threshold:
+            return check(records)
+        batches = [records[i:i + self.batch_size] for i in range(0, len(records), self.batch_size)]
+        for failure in self._pool().map(check, batches):
+            if failure:
+                return failure
+        return None
+
+    @staticmethod
+    def _record_lookup(records, parent):
+        first_height = records[0]['index'] if records else 0
+
+        def block_at(height):
+            if height >= first_height:
+                return records[height - first_height]
+            if parent is not None and height == parent['index']:
+                return parent
+            raise IndexError(f"block {height} is needed to check the difficulty target but was not supplied")
+
+        return block_at
+
+    def verify_blocks(self, blocks, parent=None, check_signatures=True, block_at=None):
+        records = [block if isinstance(block, dict) else vars(block) for block in blocks]
+        previous = parent if parent is None or isinstance(parent, dict) else vars(parent)
+        if block_at is None:
+            block_at = self._record_lookup(records, previous)
+        link_failure = None
+        try:
+            for position, record in enumerate(records):
+                if previous is not None and (
+                    record['previous_hash'] != previous['hash'] or record['index'] != previous['index'] + 1
+                ):
+                    link_failure = position, "Invalid previous hash link"
+                    break
+                error = self.retarget.check(record, record['index'], block_at)
+                if error:
+                    link_failure = position, error
+                    break
+                previous = record
+            # The blocks ahead of a broken link still get their full checks, so the reported index
+            # is always the first block that fails any check
+            checked = records if link_failure is None else records[:link_failure[0]]
+            failure = self._check_records(checked, check_signatures)
+        except (IndexError, KeyError, TypeError, ValueError) as e:
+            return {"valid": False, "index": None, "error": f"Malformed block: {e}"}
+        if failure:
+            return {"valid": False, "index": failure[0], "error": failure[1]}
+        if link_failure:
+            return {"valid": False, "index": records[link_failure[0]]['index'], "error": link_failure[1]}
+        return {"valid": True, "index": None, "error": None}
+
+    def watermark_valid(self, chain):
+        return 0 <= self.watermark < len(chain) and chain[self.watermark].hash == self.watermark_hash
+
+    def verify_chain(self, chain, full=False, check_signatures=True):
+        start_time = time.perf_counter()
+        start = 0
+        if not full and self.watermark_valid(chain):
+            start = self.watermark + 1
+        parent = chain[start - 1] if start else None
+        report = {"checked_from": start, "checked_blocks": 0}
+        window = self.batch_size * self.workers
+        for window_start in range(start, len(chain), window):
+            blocks = chain[window_start:window_start + window]
+            result = self.verify_blocks(
+                blocks, parent, check_signatures,
+                lambda height: blocks[height - window_start] if height >= window_start else chain[height]
+            )
+            if not result["valid"]:
+                # verify_blocks reports the first failing block, so every block before it passed all checks
+                failed = result["index"] if result["index"] is not None else window_start
+                self.watermark = failed - 1
+                self.watermark_hash = chain[failed - 1].hash if failed else None
+                self._save()
+                report.update(result)
+                report["seconds"] = time.perf_counter() - start_time
+                return report
+            report["checked_blocks"] += len(blocks)
+            parent = blocks[-1]
+            self.watermark = parent.index
+            self.watermark_hash = parent.hash
+            self._save()
+        report.update({"valid": True, "index": None, "error": None, "verified_height": self.watermark})
+        report["seconds"] = time.perf_counter() - start_time
+        return report
+
+    def rewind(self, height, block_hash):
+        if self.watermark > height:
+            self.watermark = height
+            self.watermark_hash = block_hash
+            self._save()
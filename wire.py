@@ -0,0 +1,299 @@
+import json
+import struct
+import zlib
+import rsa
+
+CONTENT_TYPE = "application/x-blockchain-binary"
+MAGIC = b"BCW"
+VERSION = 2
+FLAG_COMPRESSED = 1
+HEADER = struct.Struct("<3sBB")
+FLOAT = struct.Struct("<d")
+# Bounds zlib output, so a small compressed payload cannot expand into gigabytes
+MAX_BODY = 64 * 1024 * 1024
+
+T_NONE, T_TRUE, T_FALSE, T_INT, T_FLOAT, T_STR, T_HASH, T_HEX, T_JSON = range(9)
+KEY_STR, KEY_DER = range(2)
+TX_JSON, TX_COMPACT = range(2)
+TRANSACTION_FIELDS = {"sender", "receiver", "amount", "fee", "timestamp", "signature"}
+HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+class WireFormatError(ValueError):
+    pass
+
+
+def _write_varint(out, value):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _write_bytes(out, data):
+    _write_varint(out, len(data))
+    out += data
+
+
+def _is_hex(value):
+    return value and len(value) % 2 == 0 and HEX_DIGITS.issuperset(value)
+
+
+def _write_value(out, value):
+    if value is None:
+        out.append(T_NONE)
+    elif value is True:
+        out.append(T_TRUE)
+    elif value is False:
+        out.append(T_FALSE)
+    elif isinstance(value, int):
+        out.append(T_INT)
+        _write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+    elif isinstance(value, float):
+        out.append(T_FLOAT)
+        out += FLOAT.pack(value)
+    elif isinstance(value, str) and len(value) == 64 and _is_hex(value):
+        out.append(T_HASH)
+        out += bytes.fromhex(value)
+    elif isinstance(value, str) and _is_hex(value):
+        out.append(T_HEX)
+        _write_bytes(out, bytes.fromhex(value))
+    elif isinstance(value, str):
+        out.append(T_STR)
+        _write_bytes(out, value.encode())
+    else:
+        out.append(T_JSON)
+        _write_bytes(out, json.dumps(value, separators=(",", ":")).encode())
+
+
+def _der_key(address):
+    try:
+        public_key = rsa.PublicKey.load_pkcs1(address.encode())
+    except Exception:
+        return None
+    if public_key.save_pkcs1().decode() != address:
+        return None
+    return public_key.save_pkcs1("DER")
+
+
+def _is_compact_transaction(txn):
+    return (
+        isinstance(txn, dict)
+        and set(txn) == TRANSACTION_FIELDS
+        and isinstance(txn["sender"], str)
+        and isinstance(txn["receiver"], str)
+    )
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def take(self, size):
+        end = self.position + size
+        if end > len(self.data):
+            raise WireFormatError("truncated payload")
+        chunk = self.data[self.position:end]
+        self.position = end
+        return chunk
+
+    def byte(self):
+        return self.take(1)[0]
+
+    def varint(self):
+        result = shift = 0
+        while True:
+            byte = self.byte()
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return result
+            shift += 7
+
+    def bytes(self):
+        return self.take(self.varint())
+
+    def value(self):
+        tag = self.byte()
+        if tag == T_NONE:
+            return None
+        if tag == T_TRUE:
+            return True
+        if tag == T_FALSE:
+            return False
+        if tag == T_INT:
+            encoded = self.varint()
+            return encoded >> 1 if not encoded & 1 else -((encoded + 1) >> 1)
+        if tag == T_FLOAT:
+            return FLOAT.unpack(self.take(FLOAT.size))[0]
+        if tag == T_HASH:
+            return self.take(32).hex()
+        if tag == T_HEX:
+            return self.bytes().hex()
+        if tag == T_STR:
+            return self.text()
+        if tag == T_JSON:
+            try:
+                return json.loads(self.text())
+            except (ValueError, RecursionError) as e:
+                raise WireFormatError(f"invalid JSON value: {e}")
+        raise WireFormatError(f"unknown value tag {tag}")
+
+    def text(self):
+        try:
+            return self.bytes().decode()
+        except UnicodeDecodeError as e:
+            raise WireFormatError(f"invalid UTF-8 string: {e}")
+
+
+def _encode_body(blocks, length):
+    keys = {}
+    for block in blocks:
+        if isinstance(block["transactions"], list):
+            for txn in block["transactions"]:
+                if _is_compact_transaction(txn):
+                    keys.setdefault(txn["sender"], len(keys))
+                    keys.setdefault(txn["receiver"], len(keys))
+    out = bytearray()
+    _write_varint(out, length)
+    _write_varint(out, len(keys))
+    for address in keys:
+        der = _der_key(address)
+        if der is None:
+            out.append(KEY_STR)
+            _write_bytes(out, address.encode())
+        else:
+            out.append(KEY_DER)
+            _write_bytes(out, der)
+    _write_varint(out, len(blocks))
+    for block in blocks:
+        _write_value(out, block["index"])
+        _write_value(out, block["timestamp"])
+        _write_value(out, block.get("merkle_root"))
+        _write_value(out, block["previous_hash"])
+        _write_value(out, block.get("target"))
+        _write_value(out, block["nonce"])
+        _write_value(out, block["hash"])
+        transactions = block["transactions"]
+        if not isinstance(transactions, list):
+            out.append(0)
+            _write_value(out, transactions)
+            continue
+        out.append(1)
+        _write_varint(out, len(transactions))
+        for txn in transactions:
+            if not _is_compact_transaction(txn):
+                out.append(TX_JSON)
+                _write_value(out, txn)
+                continue
+            out.append(TX_COMPACT)
+            _write_varint(out, keys[txn["sender"]])
+            _write_varint(out, keys[txn["receiver"]])
+            _write_value(out, txn["amount"])
+            _write_value(out, txn["fee"])
+            _write_value(out, txn["timestamp"])
+            _write_value(out, txn["signature"])
+    return bytes(out)
+
+
+def _load_der_key(raw):
+    try:
+        return rsa.PublicKey.load_pkcs1(raw, "DER").save_pkcs1().decode()
+    except Exception as e:
+        # rsa surfaces malformed DER as pyasn1 errors, which share no base class with ValueError
+        raise WireFormatError(f"invalid DER public key: {e}")
+
+
+def _key_at(keys, position):
+    if position >= len(keys):
+        raise WireFormatError(f"key index {position} out of range")
+    return keys[position]
+
+
+def _decode_body(body):
+    reader = _Reader(body)
+    length = reader.varint()
+    keys = []
+    for _ in range(reader.varint()):
+        kind = reader.byte()
+        keys.append(_load_der_key(reader.bytes()) if kind == KEY_DER else reader.text())
+    blocks = []
+    for _ in range(reader.varint()):
+        block = {
+            "index": reader.value(),
+            "timestamp": reader.value(),
+            "merkle_root": reader.value(),
+            "previous_hash": reader.value(),
+            "target": reader.value(),
+            "nonce": reader.value(),
+            "hash": reader.value()
+        }
+        if reader.byte() == 0:
+            block["transactions"] = reader.value()
+        else:
+            transactions = []
+            for _ in range(reader.varint()):
+                if reader.byte() == TX_JSON:
+                    transactions.append(reader.value())
+                    continue
+                transactions.append({
+                    "sender": _key_at(keys, reader.varint()),
+                    "receiver": _key_at(keys, reader.varint()),
+                    "amount": reader.value(),
+                    "fee": reader.value(),
+                    "timestamp": reader.value(),
+                    "signature": reader.value()
+                })
+            block["transactions"] = transactions
+        if block["merkle_root"] is None:
+            del block["merkle_root"]
+        blocks.append(block)
+    return blocks, length
+
+
+def encode_blocks(blocks, length=None, compress=False):
+    body = _encode_body(blocks, len(blocks) if length is None else length)
+    flags = 0
+    if compress:
+        body = zlib.compress(body)
+        flags |= FLAG_COMPRESSED
+    return HEADER.pack(MAGIC, VERSION, flags) + body
+
+
+def decode_blocks(data):
+    if len(data) < HEADER.size:
+        raise WireFormatError("payload too short")
+    magic, version, flags = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise WireFormatError("not a binary chain payload")
+    if version != VERSION:
+        raise WireFormatError(f"unsupported wire format version {version}")
+    body = data[HEADER.size:]
+    if flags & FLAG_COMPRESSED:
+        decompressor = zlib.decompressobj()
+        try:
+            body = decompressor.decompress(body, MAX_BODY)
+        except zlib.error as e:
+            raise WireFormatError(f"corrupt compressed payload: {e}")
+        if decompressor.unconsumed_tail:
+            raise WireFormatError(f"decompressed payload exceeds {MAX_BODY} bytes")
+        if not decompressor.eof or decompressor.unused_data:
+            raise WireFormatError("truncated or padded compressed payload")
+    if len(body) > MAX_BODY:
+        raise WireFormatError(f"payload exceeds {MAX_BODY} bytes")
+    return _decode_body(body)
+
+
+def encode_block(block, compress=False):
+    return encode_blocks([block], compress=compress)
+
+
+def decode_block(data):
+    blocks, _ = decode_blocks(data)
+    if len(blocks) != 1:
+        raise WireFormatError("expected exactly one block")
+    return blocks[0]